@@ -0,0 +1,64 @@
+"""Measure the cost of parsing the received lines into ChatMessage records.
+
+Run from the repository root:
+
+    $ python -m benchmarks.message_parsing --count 200000
+
+The script compares decoding the raw lines, as read_msgs did before, with
+decoding and parsing them, and reports the time per line and the memory
+the kept messages take.
+"""
+import argparse
+from datetime import datetime, timedelta
+import time
+import tracemalloc
+
+from messages import parse_message
+
+
+def generate_lines(count, authors_count):
+    start_time = datetime(2021, 6, 18, 12, 0)
+    lines = []
+    for line_number in range(count):
+        # a few messages a second, so the minutes repeat like in the chat
+        sent_time = start_time + timedelta(seconds=line_number // 5)
+        timestamp = sent_time.strftime('%d.%m.%y %H:%M')
+        nickname = f'user_{line_number % authors_count}'
+        text = f'message {line_number} about nothing in particular'
+        lines.append(f'[{timestamp}] {nickname}: {text}\n'.encode())
+    return lines
+
+
+def measure(title, lines, convert):
+    start_time = time.perf_counter()
+    messages = [convert(line) for line in lines]
+    duration = time.perf_counter() - start_time
+    del messages
+
+    # tracemalloc slows the code down, so the memory is measured apart
+    tracemalloc.start()
+    messages = [convert(line) for line in lines]
+    memory_size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(title)
+    print(f'    time per line, us: {duration / len(lines) * 1e6:.2f}')
+    print(f'    memory per line, bytes: {memory_size / len(messages):.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=200000)
+    parser.add_argument('--authors_count', type=int, default=100)
+    arguments = parser.parse_args()
+
+    lines = generate_lines(arguments.count, arguments.authors_count)
+    measure('decode', lines, lambda line: line.decode())
+    measure(
+        'decode and parse',
+        lines,
+        lambda line: parse_message(line.decode())
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""Measure the chat client pipeline against the local fake server.
+
+Run from the repository root:
+
+    $ python -m benchmarks.pipeline --rate 2000 --burst_size 5000
+
+The script starts fake_server.py in a subprocess and runs the client
+coroutines without the window: read_msgs feeds the messages and history
+queues, save_messages persists the history and a consumer drains the
+messages queue the same way the chat window does. The `receive` scenario
+measures the server generated traffic, the `send` scenario pushes messages
+through send_messages and waits until the server broadcasts them back.
+"""
+import argparse
+import asyncio
+import re
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+from anyio import create_task_group
+
+from history import open_history
+from process_messages import Outbox, read_msgs, save_messages, send_messages
+
+SENT_AT_PATTERN = re.compile(r'sent_at=(\d+\.\d+)')
+
+
+class PipelineStats:
+    def __init__(self):
+        self.received_count = 0
+        self.latencies = []
+        self.received_event = asyncio.Event()
+
+    def report(self, title, duration):
+        print(title)
+        print(f'    messages: {self.received_count}')
+        throughput = self.received_count / duration
+        print(f'    throughput, messages/s: {throughput:.0f}')
+        if len(self.latencies) > 1:
+            percentiles = statistics.quantiles(self.latencies, n=100)
+            for percentile in (50, 95, 99):
+                latency = percentiles[percentile - 1] * 1000
+                print(f'    latency p{percentile}, ms: {latency:.2f}')
+            print(f'    latency max, ms: {max(self.latencies) * 1000:.2f}')
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f'    max RSS, MB: {max_rss / 1024:.1f}')
+
+
+async def consume_messages(messages_queue, stats, max_batch_size=500):
+    while True:
+        batch = [await messages_queue.get()]
+        while len(batch) < max_batch_size and not messages_queue.empty():
+            batch.append(messages_queue.get_nowait())
+        received_time = time.time()
+        for message in batch:
+            match = SENT_AT_PATTERN.search(message.text)
+            if match:
+                stats.latencies.append(received_time - float(match.group(1)))
+        stats.received_count += len(batch)
+        stats.received_event.set()
+        await asyncio.sleep(0)
+
+
+async def wait_for_port(host, port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+            continue
+        writer.close()
+        return
+
+
+async def start_server(arguments, rate, burst_size):
+    server_process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        'fake_server.py',
+        '--host', arguments.host,
+        '--reading_port', str(arguments.reading_port),
+        '--sending_port', str(arguments.sending_port),
+        '--rate', str(rate),
+        '--burst_size', str(burst_size),
+        '--burst_interval', str(arguments.burst_interval),
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    await wait_for_port(arguments.host, arguments.reading_port)
+    await wait_for_port(arguments.host, arguments.sending_port)
+    return server_process
+
+
+async def run_client(arguments, history_dir, scenario):
+    messages_queue = asyncio.Queue()
+    history_queue = asyncio.Queue()
+    sending_queue = Outbox()
+    status_updates_queue = asyncio.Queue()
+    history = open_history(f'{history_dir}/{scenario}.txt')
+    stats = PipelineStats()
+
+    async with create_task_group() as task_group:
+        await task_group.spawn(
+            read_msgs,
+            messages_queue,
+            history_queue,
+            arguments.host,
+            arguments.reading_port,
+            status_updates_queue,
+        )
+        await task_group.spawn(
+            save_messages,
+            history.create_writer(64 * 1024, 1, False),
+            history_queue,
+            status_updates_queue,
+        )
+        await task_group.spawn(consume_messages, messages_queue, stats)
+        # let the reading connection be established
+        await asyncio.sleep(0.5)
+        start_time = time.monotonic()
+
+        if scenario == 'receive':
+            await asyncio.sleep(arguments.duration)
+        else:
+            await task_group.spawn(
+                send_messages,
+                arguments.host,
+                arguments.sending_port,
+                sending_queue,
+                'benchmark',
+                status_updates_queue,
+            )
+            for message_number in range(arguments.send_count):
+                sending_queue.put_nowait(
+                    f'benchmark {message_number} sent_at={time.time():.6f}'
+                )
+            while stats.received_count < arguments.send_count:
+                stats.received_event.clear()
+                await stats.received_event.wait()
+
+        duration = time.monotonic() - start_time
+        await task_group.cancel_scope.cancel()
+
+    stats.report(scenario, duration)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--reading_port', type=int, default=5500)
+    parser.add_argument('--sending_port', type=int, default=5550)
+    parser.add_argument(
+        '--scenario',
+        choices=['receive', 'send', 'all'],
+        default='all'
+    )
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--rate', type=float, default=1000)
+    parser.add_argument('--burst_size', type=int, default=0)
+    parser.add_argument('--burst_interval', type=float, default=2)
+    parser.add_argument('--send_count', type=int, default=1000)
+    arguments = parser.parse_args()
+
+    scenarios = ['receive', 'send']
+    if arguments.scenario != 'all':
+        scenarios = [arguments.scenario]
+
+    with tempfile.TemporaryDirectory() as history_dir:
+        for scenario in scenarios:
+            if scenario == 'receive':
+                server_process = await start_server(
+                    arguments,
+                    arguments.rate,
+                    arguments.burst_size
+                )
+            else:
+                server_process = await start_server(arguments, 0, 0)
+            try:
+                await run_client(arguments, history_dir, scenario)
+            finally:
+                server_process.terminate()
+                await server_process.wait()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
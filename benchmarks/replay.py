@@ -0,0 +1,300 @@
+"""Replay a recorded chat session through the client pipeline.
+
+Record a trace with the client first:
+
+    $ python main.py --session_trace_filepath session.trace
+
+Then run from the repository root:
+
+    $ python -m benchmarks.replay session.trace --speed 0
+
+The script serves the trace from an in-process fake server. The received
+lines are written to the reading port in the recorded order and the sent
+messages are put to the outbox of send_messages, except the empty ones the
+sender skips. The client runs read_msgs, save_messages and send_messages
+like the chat window, so the same trace gives comparable numbers between
+the versions. `--speed 0` replays the trace as fast as possible,
+`--speed 1` keeps the recorded pauses. With `--render` the messages are
+shown in a Tk window, a display is required.
+"""
+import argparse
+import asyncio
+from collections import deque
+import resource
+import statistics
+import tempfile
+import time
+
+from anyio import create_task_group
+
+from benchmarks.pipeline import wait_for_port
+from fake_server import ChatServer
+from history import open_history
+from metrics import metrics
+from process_messages import filter_message, Outbox, read_msgs
+from process_messages import save_messages, send_messages
+from session_trace import read_trace, RECEIVED
+
+# give the client a turn after every batch of the fast replay
+REPLAY_BATCH_SIZE = 100
+
+
+class ReplayStats:
+    def __init__(self):
+        self.received_latencies = []
+        self.sent_latencies = []
+        self.broadcast_times = deque()
+        self.sent_times = deque()
+        self.progress_event = asyncio.Event()
+
+    def report(self, duration):
+        print(f'    duration, s: {duration:.2f}')
+        for title, latencies in (
+                ('received', self.received_latencies),
+                ('sent', self.sent_latencies),
+        ):
+            if not latencies:
+                continue
+            print(f'    {title} messages: {len(latencies)}')
+            throughput = len(latencies) / duration
+            print(f'    {title} throughput, messages/s: {throughput:.0f}')
+            if len(latencies) > 1:
+                percentiles = statistics.quantiles(latencies, n=100)
+                for percentile in (50, 95, 99):
+                    latency = percentiles[percentile - 1] * 1000
+                    print(f'    {title} latency p{percentile}, ms: '
+                          f'{latency:.2f}')
+            print(f'    {title} latency max, ms: {max(latencies) * 1000:.2f}')
+        write_summary = metrics.histogram(
+            'history_write_seconds'
+        ).get_summary()
+        # a short replay may end before the history is flushed
+        if write_summary['count']:
+            for percentile in ('p50', 'p99'):
+                write_time = write_summary[percentile] * 1000
+                print(f'    history write {percentile}, ms: {write_time:.2f}')
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f'    max RSS, MB: {max_rss / 1024:.1f}')
+
+
+class LatencyQueue(asyncio.Queue):
+    """The messages queue noting when the consumer takes a message.
+
+    The fake server does not echo the sent messages, so the messages come
+    in the order the received lines are replayed.
+    """
+    def __init__(self, stats):
+        super().__init__()
+        self.stats = stats
+
+    def get_nowait(self):
+        message = super().get_nowait()
+        broadcast_time = self.stats.broadcast_times.popleft()
+        self.stats.received_latencies.append(time.monotonic() - broadcast_time)
+        self.stats.progress_event.set()
+        return message
+
+
+class ReplayServer(ChatServer):
+    """The fake server taking the sent messages without broadcasting them.
+
+    The trace has the server echoes of the sent messages among the received
+    lines already.
+    """
+    def __init__(self, stats):
+        super().__init__()
+        self.stats = stats
+
+    def broadcast(self, nickname, text):
+        sent_time = self.stats.sent_times.popleft()
+        self.stats.sent_latencies.append(time.monotonic() - sent_time)
+        self.stats.progress_event.set()
+
+
+def get_sent_message(record):
+    # the sender skips a message with no text, the server never answers it
+    return filter_message(record.data.decode())
+
+
+async def replay_records(server, sending_queue, records, stats, speed,
+                         max_pause):
+    next_record_time = time.monotonic()
+    previous_timestamp = records[0].timestamp if records else 0
+    for record_number, record in enumerate(records):
+        if speed:
+            # a trace appended by several sessions has long or negative gaps
+            pause = min(max(record.timestamp - previous_timestamp, 0),
+                        max_pause)
+            previous_timestamp = record.timestamp
+            next_record_time += pause / speed
+            await asyncio.sleep(next_record_time - time.monotonic())
+        elif record_number % REPLAY_BATCH_SIZE == 0:
+            await asyncio.sleep(0)
+
+        if record.kind == RECEIVED:
+            stats.broadcast_times.append(time.monotonic())
+            server.broadcast_line(record.data)
+        else:
+            message = get_sent_message(record)
+            if not message:
+                continue
+            stats.sent_times.append(time.monotonic())
+            sending_queue.put_nowait(message)
+
+
+async def drain_messages(messages_queue, max_batch_size=500):
+    # the same batches the chat window takes without drawing them
+    while True:
+        await messages_queue.get()
+        for _ in range(min(max_batch_size, messages_queue.qsize())):
+            messages_queue.get_nowait()
+        await asyncio.sleep(0)
+
+
+async def spawn_renderer(task_group, messages_queue, history):
+    import tkinter as tk
+    from tkinter.scrolledtext import ScrolledText
+
+    from gui import HistoryWindow, update_conversation_history, update_tk
+
+    root = tk.Tk()
+    root.title('Replay benchmark')
+    panel = ScrolledText(root, wrap='none')
+    panel.pack(fill='both', expand=True)
+    await task_group.spawn(update_tk, root)
+    await task_group.spawn(
+        update_conversation_history,
+        panel,
+        messages_queue,
+        HistoryWindow(history),
+        2000,
+    )
+    return root
+
+
+async def wait_for_replay(stats, received_count, sent_count):
+    while (
+            len(stats.received_latencies) < received_count
+            or len(stats.sent_latencies) < sent_count
+    ):
+        stats.progress_event.clear()
+        await stats.progress_event.wait()
+
+
+async def run_replay(arguments, records, history_dir):
+    stats = ReplayStats()
+    server = ReplayServer(stats)
+    messages_queue = LatencyQueue(stats)
+    history_queue = asyncio.Queue()
+    sending_queue = Outbox()
+    status_updates_queue = asyncio.Queue()
+    history = open_history(
+        f'{history_dir}/replay.txt',
+        arguments.history_format
+    )
+    received_count = sum(record.kind == RECEIVED for record in records)
+    sent_count = sum(
+        bool(get_sent_message(record))
+        for record in records
+        if record.kind != RECEIVED
+    )
+    root = None
+
+    async with create_task_group() as task_group:
+        await task_group.spawn(
+            server.serve,
+            arguments.host,
+            arguments.reading_port,
+            arguments.sending_port,
+        )
+        await wait_for_port(arguments.host, arguments.reading_port)
+        await task_group.spawn(
+            read_msgs,
+            messages_queue,
+            history_queue,
+            arguments.host,
+            arguments.reading_port,
+            status_updates_queue,
+        )
+        await task_group.spawn(
+            save_messages,
+            history.create_writer(64 * 1024, 1, False),
+            history_queue,
+            status_updates_queue,
+        )
+        if arguments.render:
+            root = await spawn_renderer(task_group, messages_queue, history)
+        else:
+            await task_group.spawn(drain_messages, messages_queue)
+        if sent_count:
+            await task_group.spawn(
+                send_messages,
+                arguments.host,
+                arguments.sending_port,
+                sending_queue,
+                'replay',
+                status_updates_queue,
+            )
+        # let the connections be established
+        await asyncio.sleep(0.5)
+
+        start_time = time.monotonic()
+        await task_group.spawn(
+            replay_records,
+            server,
+            sending_queue,
+            records,
+            stats,
+            arguments.speed,
+            arguments.max_pause,
+        )
+        await wait_for_replay(stats, received_count, sent_count)
+        duration = time.monotonic() - start_time
+        await task_group.cancel_scope.cancel()
+
+    if root:
+        root.destroy()
+    stats.report(duration)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('trace_filepath')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--reading_port', type=int, default=5600)
+    parser.add_argument('--sending_port', type=int, default=5650)
+    parser.add_argument(
+        '--speed',
+        type=float,
+        default=0,
+        help="""
+        The replay speed relative to the recorded one, zero replays the
+        trace as fast as possible.
+        """
+    )
+    parser.add_argument(
+        '--max_pause',
+        type=float,
+        default=5,
+        help='Max seconds between the replayed records.'
+    )
+    parser.add_argument(
+        '--history_format',
+        choices=['plain', 'segmented', 'compressed'],
+        default='plain'
+    )
+    parser.add_argument(
+        '--render',
+        action='store_true',
+        help='Show the messages in a Tk window.'
+    )
+    arguments = parser.parse_args()
+
+    records = await read_trace(arguments.trace_filepath)
+    print(f'{arguments.trace_filepath}: {len(records)} records')
+    with tempfile.TemporaryDirectory() as history_dir:
+        await run_replay(arguments, records, history_dir)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""Measure how fast the chat client starts.
+
+Run from the repository root, a display is required:
+
+    $ python -m benchmarks.startup --runs 5
+
+The script reports the time to import the client modules and runs the
+client against the local fake server to report when the window gets
+visible and when the first message from the server is shown. The client
+times are counted from the start of the metrics module and read from the
+metrics file the client dumps.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.pipeline import start_server
+
+IMPORT_SCRIPT = (
+    'import time; start_time = time.perf_counter(); '
+    'import main, gui; print(time.perf_counter() - start_time)'
+)
+STARTUP_HISTOGRAMS = (
+    'startup_window_seconds',
+    'startup_first_message_seconds',
+)
+
+
+async def measure_import_time():
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        '-c',
+        IMPORT_SCRIPT,
+        stdout=asyncio.subprocess.PIPE,
+    )
+    stdout, _ = await process.communicate()
+    return float(stdout)
+
+
+def read_startup_times(metrics_filepath):
+    try:
+        with open(metrics_filepath) as metrics_file:
+            histograms = json.load(metrics_file)['histograms']
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    if not all(name in histograms for name in STARTUP_HISTOGRAMS):
+        return None
+    return [histograms[name]['max'] for name in STARTUP_HISTOGRAMS]
+
+
+async def measure_client_startup(arguments, run_dir):
+    metrics_filepath = os.path.join(run_dir, 'metrics.json')
+    start_time = time.monotonic()
+    client_process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        'main.py',
+        '--host', arguments.host,
+        '--reading_port', str(arguments.reading_port),
+        '--sending_port', str(arguments.sending_port),
+        '--history_filepath', os.path.join(run_dir, 'history.txt'),
+        '--metrics_interval', '0.1',
+        '--metrics_filepath', metrics_filepath,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        while time.monotonic() - start_time < arguments.timeout:
+            startup_times = read_startup_times(metrics_filepath)
+            if startup_times:
+                return startup_times
+            await asyncio.sleep(0.1)
+        raise TimeoutError('The client did not show a message in time')
+    finally:
+        client_process.terminate()
+        await client_process.wait()
+
+
+def report(title, values):
+    print(title)
+    print(f'    median, ms: {statistics.median(values) * 1000:.1f}')
+    print(f'    max, ms: {max(values) * 1000:.1f}')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--reading_port', type=int, default=5500)
+    parser.add_argument('--sending_port', type=int, default=5550)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--rate', type=float, default=20)
+    parser.add_argument('--timeout', type=float, default=30)
+    arguments = parser.parse_args()
+    arguments.burst_interval = 0
+
+    import_times = [await measure_import_time() for _ in range(arguments.runs)]
+    report('import', import_times)
+
+    server_process = await start_server(arguments, arguments.rate, 0)
+    window_times, message_times = [], []
+    try:
+        for _ in range(arguments.runs):
+            with tempfile.TemporaryDirectory() as run_dir:
+                window_time, message_time = await measure_client_startup(
+                    arguments,
+                    run_dir
+                )
+            window_times.append(window_time)
+            message_times.append(message_time)
+    finally:
+        server_process.terminate()
+        await server_process.wait()
+    report('window visible', window_times)
+    report('first live message', message_times)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
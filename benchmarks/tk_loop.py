@@ -0,0 +1,89 @@
+"""Compare the fixed 120 Hz Tk polling with the adaptive TkPacer.
+
+Run from the repository root, a display is required:
+
+    $ python -m benchmarks.tk_loop --duration 10
+
+For each mode the script reports the CPU time the idle window consumes and
+the delay between a Tk event being queued and being processed.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import tkinter as tk
+
+from anyio import create_task_group
+
+from gui import TkPacer, update_tk
+
+
+async def measure_latency(root, samples, pause):
+    delays = []
+    for _ in range(samples):
+        await asyncio.sleep(pause)
+        queued_time = time.monotonic()
+        processed = asyncio.Event()
+
+        def on_event():
+            delays.append(time.monotonic() - queued_time)
+            processed.set()
+
+        root.after(0, on_event)
+        await processed.wait()
+    return delays
+
+
+async def run_mode(tk_pacer, duration, samples):
+    root = tk.Tk()
+    root.title('Tk loop benchmark')
+    report = {}
+
+    async with create_task_group() as task_group:
+        await task_group.spawn(update_tk, root, tk_pacer)
+        # let the pacer reach its idle state
+        await asyncio.sleep(tk_pacer.idle_timeout + 0.5)
+
+        wakeups_count = tk_pacer.wakeups_count
+        cpu_time = time.process_time()
+        await asyncio.sleep(duration)
+        report['idle CPU, %'] = (
+            (time.process_time() - cpu_time) / duration * 100
+        )
+        report['idle wakeups/s'] = (
+            (tk_pacer.wakeups_count - wakeups_count) / duration
+        )
+
+        delays = await measure_latency(root, samples, pause=2)
+        report['event latency median, ms'] = statistics.median(delays) * 1000
+        report['event latency max, ms'] = max(delays) * 1000
+        await task_group.cancel_scope.cancel()
+
+    root.destroy()
+    return report
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--samples', type=int, default=5)
+    parser.add_argument('--idle_interval', type=float, default=0.1)
+    arguments = parser.parse_args()
+
+    modes = {
+        'fixed 120 Hz': TkPacer(max_interval=1 / 120),
+        'adaptive': TkPacer(max_interval=arguments.idle_interval),
+    }
+    for mode_name, tk_pacer in modes.items():
+        report = await run_mode(
+            tk_pacer,
+            arguments.duration,
+            arguments.samples
+        )
+        print(mode_name)
+        for metric, value in report.items():
+            print(f'    {metric}: {value:.2f}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,173 @@
+"""Register many chat users at once without the window.
+
+    $ python bulk_registration.py nicknames.txt --tokens_filepath tokens.txt
+
+The nicknames file has a nickname per line. The users are registered
+concurrently and every token is written as `nickname<TAB>token` as soon as
+the server sends it, so an interrupted run keeps the tokens it got.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+from anyio import create_task_group
+from async_timeout import timeout
+
+from metrics import Histogram
+from open_connection import ConnectionAttemptsExceeded, open_connection
+from open_connection import ReconnectPolicy
+from process_messages import sign_up
+
+logger = logging.getLogger('bulk_registration')
+
+
+class RegistrationStats:
+    def __init__(self):
+        self.registered_count = 0
+        self.failed_count = 0
+        self.durations = Histogram()
+        self.start_time = time.monotonic()
+
+    def report(self):
+        duration = max(time.monotonic() - self.start_time, 1e-9)
+        summary = self.durations.get_summary()
+        logger.info(
+            f'Registered {self.registered_count} users, '
+            f'failed {self.failed_count} in {duration:.1f}s, '
+            f'{self.registered_count / duration:.1f} users/s, '
+            f'p50={summary["p50"] * 1000:.0f}ms '
+            f'p99={summary["p99"] * 1000:.0f}ms'
+        )
+
+
+async def register_user(host, port, nickname, reconnect_policy,
+                        request_timeout):
+    async with open_connection(host, port, reconnect_policy) as (
+            reader,
+            writer
+    ):
+        async with timeout(request_timeout):
+            user_features = await sign_up(reader, writer, nickname)
+    reconnect_policy.reset()
+    try:
+        return user_features['account_hash']
+    except (TypeError, KeyError):
+        return None
+
+
+async def run_registration_worker(
+        nicknames_queue,
+        tokens_file,
+        stats,
+        arguments,
+):
+    reconnect_policy = ReconnectPolicy(
+        arguments.connect_timeout,
+        max_attempts=arguments.max_attempts,
+    )
+    while not nicknames_queue.empty():
+        nickname = nicknames_queue.get_nowait()
+        start_time = time.monotonic()
+        try:
+            token = await register_user(
+                arguments.host,
+                arguments.port,
+                nickname,
+                reconnect_policy,
+                arguments.request_timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.error(f'{nickname}: the server does not respond')
+            token = None
+        except (ConnectionAttemptsExceeded, ConnectionError) as error:
+            logger.error(f'{nickname}: {error}')
+            token = None
+        stats.durations.observe(time.monotonic() - start_time)
+
+        if not token:
+            stats.failed_count += 1
+            continue
+        stats.registered_count += 1
+        tokens_file.write(f'{nickname}\t{token}\n')
+        tokens_file.flush()
+
+
+async def register_users(nicknames, tokens_file, arguments):
+    nicknames_queue = asyncio.Queue()
+    for nickname in nicknames:
+        nicknames_queue.put_nowait(nickname)
+    stats = RegistrationStats()
+    # the number of workers bounds the number of open connections
+    async with create_task_group() as task_group:
+        for _ in range(arguments.concurrency):
+            await task_group.spawn(
+                run_registration_worker,
+                nicknames_queue,
+                tokens_file,
+                stats,
+                arguments,
+            )
+    return stats
+
+
+def read_nicknames(nicknames_filepath):
+    if nicknames_filepath == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(nicknames_filepath, encoding='utf-8') as nicknames_file:
+            lines = nicknames_file.readlines()
+    return [line.strip() for line in lines if line.strip()]
+
+
+def main():
+    logging.basicConfig(format='%(asctime)s:%(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'nicknames_filepath',
+        help='A file with a nickname per line, "-" reads the standard input.'
+    )
+    parser.add_argument('--host', default='minechat.dvmn.org')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument(
+        '--tokens_filepath',
+        help='A file to append the tokens to, the standard output by default.'
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=20,
+        help='Number of users registered at the same time.'
+    )
+    parser.add_argument('--connect_timeout', type=float, default=10)
+    parser.add_argument(
+        '--request_timeout',
+        type=float,
+        default=10,
+        help='Seconds to wait for the server to register a user.'
+    )
+    parser.add_argument(
+        '--max_attempts',
+        type=int,
+        default=3,
+        help='Number of attempts to connect for every user.'
+    )
+    arguments = parser.parse_args()
+
+    nicknames = read_nicknames(arguments.nicknames_filepath)
+    tokens_file = sys.stdout
+    if arguments.tokens_filepath:
+        tokens_file = open(arguments.tokens_filepath, 'a', encoding='utf-8')
+    try:
+        stats = asyncio.run(register_users(nicknames, tokens_file, arguments))
+    except KeyboardInterrupt:
+        return
+    finally:
+        if tokens_file is not sys.stdout:
+            tokens_file.close()
+    stats.report()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import os
+
+MAIN_CHANNEL_NAME = 'main'
+
+
+class Channel:
+    """A chat server the client follows with its own history and queues.
+
+    The client sends the messages only to the channels with a sending
+    queue, the other ones are monitored.
+    """
+    def __init__(self, name, host, reading_port, sending_port=None,
+                 token='', history_filepath='chat_history.txt',
+                 search_index_filepath='', session_trace_filepath=''):
+        self.name = name
+        self.host = host
+        self.reading_port = reading_port
+        self.sending_port = sending_port
+        self.token = token
+        self.history_filepath = history_filepath
+        self.search_index_filepath = search_index_filepath
+        self.session_trace_filepath = session_trace_filepath
+        self.messages_queue = None
+        self.history_queue = None
+        self.sending_queue = None
+        self.status_updates_queue = None
+
+    def get_queue_name(self, queue_name):
+        if self.name == MAIN_CHANNEL_NAME:
+            return queue_name
+        return f'{self.name}.{queue_name}'
+
+
+def parse_channel_spec(channel_spec):
+    """Parse the `name=host:reading_port` channel description."""
+    name, separator, address = channel_spec.partition('=')
+    host, _, reading_port = address.rpartition(':')
+    if not separator or not name or not host or not reading_port.isdigit():
+        raise ValueError(
+            f'The channel "{channel_spec}" is not like name=host:port'
+        )
+    return name, host, int(reading_port)
+
+
+def get_channel_filepath(filepath, channel_name):
+    """Make a file path of the channel next to the main channel file."""
+    if not filepath:
+        return filepath
+    # chat_history.txt turns to chat_history.channel.txt
+    root, extension = os.path.splitext(filepath)
+    return f'{root}.{channel_name}{extension}'
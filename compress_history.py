@@ -0,0 +1,63 @@
+"""Convert a plain text chat history to the compressed history format.
+
+    $ python compress_history.py chat_history.txt chat_history.txt.gz
+
+Then run the client with `--history_format compressed` and the new file
+path. The plain file is left as it is.
+"""
+import argparse
+import asyncio
+import os
+
+from history import CompressedHistory, get_file_size, iter_file_lines
+
+
+async def compress_history(source_filepath, target_filepath, block_size):
+    history = CompressedHistory(target_filepath)
+    # the blocks are cut by size only, the whole file is written at once
+    history_writer = history.create_writer(
+        block_size,
+        flush_interval=float('inf'),
+        fsync=False
+    )
+    async with history_writer:
+        async for _, line in iter_file_lines(
+                source_filepath,
+                include_last_line=True
+        ):
+            if not line.endswith('\n'):
+                # the source file does not end with a line break
+                line += '\n'
+            history_writer.add(line)
+            if history_writer.is_flush_due():
+                await history_writer.flush()
+    return get_file_size(source_filepath), get_file_size(target_filepath)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('source_filepath')
+    parser.add_argument('target_filepath')
+    parser.add_argument(
+        '--block_size',
+        type=int,
+        default=64 * 1024,
+        help='Number of characters compressed in one block.'
+    )
+    input_arguments = parser.parse_args()
+    if os.path.exists(input_arguments.target_filepath):
+        parser.error(f'{input_arguments.target_filepath} already exists')
+
+    source_size, target_size = asyncio.run(compress_history(
+        input_arguments.source_filepath,
+        input_arguments.target_filepath,
+        input_arguments.block_size,
+    ))
+    print(
+        f'{source_size} bytes compressed to {target_size} bytes '
+        f'in {input_arguments.target_filepath}'
+    )
+
+
+if __name__ == '__main__':
+    main()
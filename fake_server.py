@@ -0,0 +1,231 @@
+"""A local stand-in for the minechat server.
+
+It speaks the same line protocol as minechat.dvmn.org: the reading port
+broadcasts the chat messages, the sending port authorizes a user by the
+token or registers a new one and accepts messages ended by an empty line.
+The server can also generate messages with a given rate and bursts, so the
+client can be measured without the real chat:
+
+    $ python fake_server.py --rate 100 --burst_size 1000 --burst_interval 10
+"""
+import argparse
+import asyncio
+from collections import deque
+from datetime import datetime
+from itertools import count
+import json
+import logging
+import time
+import uuid
+
+from logs import start_logging
+
+logger = logging.getLogger('fake_server')
+
+GREETING = (
+    'Hello %username%! Enter your personal hash or leave it empty '
+    'to create new account.\n'
+)
+NICKNAME_REQUEST = 'Enter preferred nickname below:\n'
+WELCOME = (
+    'Welcome to chat! Post your message below. End it with an empty line.\n'
+)
+MESSAGE_SENT = 'Message send. Write more, end message with an empty line.\n'
+# stop writing to a reader which does not read its messages
+MAX_WRITE_BUFFER_SIZE = 16 * 1024 * 1024
+
+
+class ChatServer:
+    def __init__(self, rate=0, burst_size=0, burst_interval=0, backlog=0,
+                 strict_tokens=False):
+        self.rate = rate
+        self.burst_size = burst_size
+        self.burst_interval = burst_interval
+        self.strict_tokens = strict_tokens
+        self.accounts = {}
+        self.reader_writers = set()
+        self.backlog = deque(maxlen=backlog)
+        self.message_numbers = count()
+
+    def register(self, nickname):
+        token = uuid.uuid4().hex
+        self.accounts[token] = nickname
+        return {'nickname': nickname, 'account_hash': token}
+
+    def authorize(self, token):
+        if token not in self.accounts:
+            if self.strict_tokens:
+                return None
+            self.accounts[token] = f'user_{token[:6]}'
+        return {'nickname': self.accounts[token], 'account_hash': token}
+
+    def broadcast(self, nickname, text):
+        timestamp = datetime.now().strftime('%d.%m.%y %H:%M')
+        self.broadcast_line(f'[{timestamp}] {nickname}: {text}\n'.encode())
+
+    def broadcast_line(self, line):
+        self.backlog.append(line)
+        for writer in list(self.reader_writers):
+            buffer_size = writer.transport.get_write_buffer_size()
+            if buffer_size > MAX_WRITE_BUFFER_SIZE:
+                logger.warning('Drop a reader which does not read messages')
+                self.reader_writers.discard(writer)
+                writer.close()
+                continue
+            writer.write(line)
+
+    def generate_message(self):
+        message_number = next(self.message_numbers)
+        self.broadcast(
+            'Bot',
+            f'message {message_number} sent_at={time.time():.6f}'
+        )
+
+    async def generate_messages(self):
+        tick = 0.01
+        pending_messages = 0
+        next_burst_time = time.monotonic() + self.burst_interval
+        while True:
+            await asyncio.sleep(tick)
+            pending_messages += self.rate * tick
+            while pending_messages >= 1:
+                self.generate_message()
+                pending_messages -= 1
+            if self.burst_size and time.monotonic() >= next_burst_time:
+                for _ in range(self.burst_size):
+                    self.generate_message()
+                next_burst_time += self.burst_interval
+
+    async def handle_reader(self, reader, writer):
+        for line in self.backlog:
+            writer.write(line)
+        self.reader_writers.add(writer)
+        try:
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.reader_writers.discard(writer)
+            writer.close()
+
+    async def handle_sender(self, reader, writer):
+        try:
+            writer.write(GREETING.encode())
+            token = (await reader.readline()).decode().strip()
+            if token:
+                user_features = self.authorize(token)
+            else:
+                writer.write(NICKNAME_REQUEST.encode())
+                nickname = (await reader.readline()).decode().strip()
+                user_features = self.register(nickname)
+            writer.write(f'{json.dumps(user_features)}\n'.encode())
+            if not user_features:
+                return
+            writer.write(WELCOME.encode())
+
+            message_lines = []
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                line = line.decode().rstrip('\n')
+                if line:
+                    message_lines.append(line)
+                    continue
+                if message_lines:
+                    self.broadcast(
+                        user_features['nickname'],
+                        ' '.join(message_lines)
+                    )
+                    message_lines = []
+                writer.write(MESSAGE_SENT.encode())
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, reading_port, sending_port):
+        reading_server = await asyncio.start_server(
+            self.handle_reader,
+            host,
+            reading_port
+        )
+        sending_server = await asyncio.start_server(
+            self.handle_sender,
+            host,
+            sending_port
+        )
+        logger.info(
+            f'Serve on {host}, reading port {reading_port}, '
+            f'sending port {sending_port}'
+        )
+        async with reading_server, sending_server:
+            if self.rate or self.burst_size:
+                await self.generate_messages()
+            else:
+                await asyncio.Event().wait()
+
+
+def get_input_arguments():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--reading_port', type=int, default=5000)
+    parser.add_argument('--sending_port', type=int, default=5050)
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=0,
+        help='Number of generated messages per second.'
+    )
+    parser.add_argument(
+        '--burst_size',
+        type=int,
+        default=0,
+        help='Number of messages generated at once every burst interval.'
+    )
+    parser.add_argument('--burst_interval', type=float, default=10)
+    parser.add_argument(
+        '--backlog',
+        type=int,
+        default=0,
+        help='Number of the last messages sent to a new reader.'
+    )
+    parser.add_argument(
+        '--strict_tokens',
+        action='store_true',
+        help='Refuse the tokens the server has not registered.'
+    )
+    return parser.parse_args()
+
+
+def main():
+    input_arguments = get_input_arguments()
+    # the console writes do not slow down the served chat
+    log_listener = start_logging({
+        'fake_server': (
+            logging.INFO,
+            logging.Formatter('%(asctime)s:%(message)s'),
+        ),
+    })
+    server = ChatServer(
+        input_arguments.rate,
+        input_arguments.burst_size,
+        input_arguments.burst_interval,
+        input_arguments.backlog,
+        input_arguments.strict_tokens,
+    )
+    try:
+        asyncio.run(server.serve(
+            input_arguments.host,
+            input_arguments.reading_port,
+            input_arguments.sending_port,
+        ))
+    except KeyboardInterrupt:
+        return
+    finally:
+        log_listener.stop()
+
+
+if __name__ == '__main__':
+    main()
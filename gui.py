@@ -1,14 +1,18 @@
 import asyncio
+from collections import deque
 import logging
+import time
 import tkinter as tk
+from tkinter import ttk
 from tkinter.scrolledtext import ScrolledText
 
 from anyio import create_task_group
-import aiofiles
+from async_timeout import timeout
 
-from process_messages import read_msgs, send_messages, save_messages
-from process_messages import watch_for_connection
-from statuses import NicknameReceived, ReadConnectionStateChanged
+from metrics import metrics, report_metrics
+from process_messages import connect_channel, save_channel_history
+from statuses import ErrorOccurred, NicknameReceived
+from statuses import ReadConnectionStateChanged, ReconnectScheduled
 from statuses import SendingConnectionStateChanged
 
 
@@ -19,41 +23,536 @@ class TkAppClosed(Exception):
     pass
 
 
+class TkPacer:
+    """Choose how often the Tk events are processed.
+
+    The pacer polls Tk every `min_interval` seconds while the user works
+    with the window or the messages arrive. After `idle_timeout` seconds
+    without any activity the interval grows up to `max_interval`.
+
+    A new message wakes the loop at once. The input handlers run only inside
+    `update()`, so the first key press or click of an idle window waits for
+    the next poll, up to `max_interval`, and the following ones are polled
+    fast. The pointer motion is not watched, moving the mouse over the
+    window would keep the loop busy.
+    """
+    input_events = ('<Key>', '<Button>', '<MouseWheel>')
+
+    def __init__(self, min_interval=1 / 120, max_interval=1 / 10,
+                 idle_timeout=1):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_timeout = idle_timeout
+        self.interval = min_interval
+        self.last_activity_time = time.monotonic()
+        self.wakeup_event = asyncio.Event()
+        self.wakeups_count = 0
+
+    def watch_input(self, root_frame):
+        for event_sequence in self.input_events:
+            root_frame.bind_all(event_sequence, self.notify, add='+')
+
+    def notify(self, event=None):
+        self.last_activity_time = time.monotonic()
+        self.interval = self.min_interval
+        self.wakeup_event.set()
+
+    def get_interval(self):
+        idle_time = time.monotonic() - self.last_activity_time
+        if idle_time >= self.idle_timeout:
+            self.interval = min(self.interval * 1.5, self.max_interval)
+        return self.interval
+
+    async def wait(self):
+        try:
+            async with timeout(self.get_interval()) as timeout_manager:
+                await self.wakeup_event.wait()
+        except asyncio.TimeoutError:
+            if not timeout_manager.expired:
+                raise
+        self.wakeup_event.clear()
+        self.wakeups_count += 1
+
+
+class NotificationBanner:
+    """A strip on the top of the window showing the errors.
+
+    Unlike a message box the banner does not run a modal Tk loop, so the
+    network and the history keep working while the user reads it. A warning
+    hides itself after `warning_timeout` seconds, an error stays till the
+    user closes it.
+    """
+    colors = {True: '#fff3cd', False: '#f8d7da'}
+
+    def __init__(self, root_frame, warning_timeout=10):
+        self.root_frame = root_frame
+        self.warning_timeout = warning_timeout
+        self.frame = tk.Frame(root_frame)
+        self.label = tk.Label(
+            self.frame,
+            anchor='w',
+            justify='left',
+            font='arial 10'
+        )
+        self.label.pack(side="left", fill=tk.X, expand=True)
+        close_button = tk.Button(self.frame, text='✕', command=self.hide)
+        close_button.pack(side="right")
+        self.is_shown = False
+        self.hide_job = None
+
+    def show(self, title, message, is_warning=False):
+        self.label['text'] = f'{title}. {message}'
+        self.label['bg'] = self.frame['bg'] = self.colors[is_warning]
+        if not self.is_shown:
+            packed_widgets = self.root_frame.pack_slaves()
+            if packed_widgets:
+                self.frame.pack(
+                    side="top",
+                    fill=tk.X,
+                    before=packed_widgets[0]
+                )
+            else:
+                self.frame.pack(side="top", fill=tk.X)
+            self.is_shown = True
+
+        if self.hide_job:
+            self.frame.after_cancel(self.hide_job)
+            self.hide_job = None
+        if is_warning:
+            self.hide_job = self.frame.after(
+                int(self.warning_timeout * 1000),
+                self.hide
+            )
+
+    def hide(self):
+        self.hide_job = None
+        self.frame.pack_forget()
+        self.is_shown = False
+
+
+class HistoryRun:
+    """Panel lines read one after another from the history."""
+    __slots__ = ('start_position', 'line_count')
+
+    def __init__(self, start_position, line_count):
+        self.start_position = start_position
+        self.line_count = line_count
+
+
+class HistoryWindow:
+    """The part of the history the conversation panel holds.
+
+    The panel lines are kept as runs: a HistoryRun for the lines read from
+    the history and a ChatMessage for every new message shown as it came.
+    A new message learns its history position only when it is written, so
+    the window is never cut at a message which is not written yet.
+
+    The window starts at `start_position`. While `end_position` is None the
+    panel ends with the new messages, else it ends before `end_position` and
+    the new messages wait in `pending_messages` till the user scrolls down
+    to them. Only the pending messages not written yet are kept, the written
+    ones are read from the history then.
+    """
+    def __init__(self, history, start_position=None):
+        self.history = history
+        if start_position is None:
+            start_position = history.get_end_position()
+        self.start_position = start_position
+        self.end_position = None
+        self.runs = deque()
+        self.line_count = 0
+        self.pending_messages = deque()
+        self.is_loading = False
+        # the loads and the trims wait for each other
+        self.lock = asyncio.Lock()
+
+    def is_following(self):
+        return self.end_position is None
+
+    def get_message_position(self, message):
+        if message.history_location is None:
+            return None
+        return self.history.get_position(*message.history_location)
+
+    def prepend_lines(self, lines, start_position):
+        if lines:
+            self.runs.appendleft(HistoryRun(start_position, len(lines)))
+            self.line_count += len(lines)
+        self.start_position = start_position
+
+    def append_lines(self, lines, end_position):
+        if lines:
+            self.runs.append(HistoryRun(self.end_position, len(lines)))
+            self.line_count += len(lines)
+        self.end_position = end_position
+
+    def append_messages(self, messages):
+        self.runs.extend(messages)
+        self.line_count += len(messages)
+
+    def add_pending_messages(self, messages):
+        self.pending_messages.extend(messages)
+        self.pending_messages = deque(
+            message for message in self.pending_messages
+            if message.history_location is None
+        )
+
+    def follow(self, end_position):
+        """Return the pending messages missing in the history read so far."""
+        messages = [
+            message for message in self.pending_messages
+            if self.get_message_position(message) is None
+            or self.get_message_position(message) >= end_position
+        ]
+        self.pending_messages.clear()
+        self.end_position = None
+        return messages
+
+    async def trim_top(self, excess_lines):
+        """Drop up to `excess_lines` first lines, return the dropped count.
+
+        The new first line must have a known history position, so less lines
+        are dropped when the cut falls on a message not written yet.
+        """
+        cut_run_index, cut_run_lines, dropped_count = 0, 0, 0
+        line_number = 0
+        for run_index, run in enumerate(self.runs):
+            if line_number > excess_lines:
+                break
+            if isinstance(run, HistoryRun):
+                cut_run_index = run_index
+                cut_run_lines = min(
+                    excess_lines - line_number,
+                    run.line_count - 1
+                )
+                dropped_count = line_number + cut_run_lines
+                line_number += run.line_count
+                continue
+            if self.get_message_position(run) is not None:
+                cut_run_index, cut_run_lines = run_index, 0
+                dropped_count = line_number
+            line_number += 1
+        if not dropped_count:
+            return 0
+
+        first_run = self.runs[cut_run_index]
+        if isinstance(first_run, HistoryRun):
+            start_position = await self.history.skip_lines(
+                first_run.start_position,
+                cut_run_lines
+            )
+            first_run.start_position = start_position
+            first_run.line_count -= cut_run_lines
+        else:
+            start_position = self.get_message_position(first_run)
+        for _ in range(cut_run_index):
+            self.runs.popleft()
+        self.start_position = start_position
+        self.line_count -= dropped_count
+        return dropped_count
+
+    async def trim_bottom(self, kept_line_count):
+        """Keep the first `kept_line_count` lines and stop following.
+
+        The first dropped line must have a known history position, so more
+        lines are kept when the cut falls on a message not written yet.
+        Return the kept count or None if nothing can be dropped now.
+        """
+        line_number = 0
+        for run_index, run in enumerate(self.runs):
+            if isinstance(run, HistoryRun):
+                if line_number + run.line_count > kept_line_count:
+                    kept_run_lines = max(kept_line_count - line_number, 0)
+                    end_position = await self.history.skip_lines(
+                        run.start_position,
+                        kept_run_lines
+                    )
+                    break
+                line_number += run.line_count
+                continue
+            if line_number >= kept_line_count:
+                end_position = self.get_message_position(run)
+                if end_position is not None:
+                    kept_run_lines = 0
+                    break
+            line_number += 1
+        else:
+            return None
+
+        # the messages shown during the skip are dropped too
+        dropped_runs = [
+            self.runs.pop() for _ in range(len(self.runs) - run_index)
+        ]
+        cut_run = dropped_runs.pop()
+        if kept_run_lines:
+            cut_run.line_count = kept_run_lines
+            self.runs.append(cut_run)
+        else:
+            dropped_runs.append(cut_run)
+        # the messages which are not written yet are not read from the
+        # history later, show them after it
+        self.pending_messages.extendleft(
+            run for run in dropped_runs
+            if not isinstance(run, HistoryRun)
+            and run.history_location is None
+        )
+        self.line_count = line_number + kept_run_lines
+        self.end_position = end_position
+        return self.line_count
+
+
 def process_new_message(input_field, sending_queue):
     text = input_field.get()
     sending_queue.put_nowait(text)
     input_field.delete(0, tk.END)
 
 
-def display_message(panel, message):
+def display_messages(panel, messages, autoscroll=True):
+    text = '\n'.join(message.strip() for message in messages)
+    # follow the new messages unless the user reads the earlier ones
+    is_at_bottom = panel.yview()[1] >= 1
     panel['state'] = 'normal'
     if panel.index('end-1c') != '1.0':
-        panel.insert('end', '\n')
-    panel.insert('end', message.strip())
-    # TODO сделать промотку умной, чтобы не мешала просматривать историю сообщений
-    # ScrolledText.frame
-    # ScrolledText.vbar
-    panel.yview(tk.END)
+        text = '\n' + text
+    panel.insert('end', text)
+    if autoscroll and is_at_bottom:
+        panel.yview(tk.END)
+    panel['state'] = 'disabled'
+
+
+def get_visible_lines(panel):
+    first_line = int(panel.index('@0,0').split('.')[0])
+    last_line = int(panel.index(f'@0,{panel.winfo_height()}').split('.')[0])
+    return first_line, last_line
+
+
+async def trim_panel_top(panel, history_window, excess_lines):
+    first_visible_line, _ = get_visible_lines(panel)
+    # never drop the lines the user looks at
+    excess_lines = min(excess_lines, first_visible_line - 1)
+    if excess_lines <= 0:
+        return
+    dropped_count = await history_window.trim_top(excess_lines)
+    if not dropped_count:
+        return
+    first_visible_line, _ = get_visible_lines(panel)
+    panel['state'] = 'normal'
+    panel.delete('1.0', f'{dropped_count + 1}.0')
     panel['state'] = 'disabled'
+    # keep the user looking at the same lines
+    panel.yview(f'{max(first_visible_line - dropped_count, 1)}.0')
+
+
+async def trim_panel_bottom(panel, history_window, kept_line_count):
+    kept_line_count = await history_window.trim_bottom(kept_line_count)
+    if kept_line_count is None:
+        return
+    panel['state'] = 'normal'
+    panel.delete(f'{kept_line_count}.end', 'end-1c')
+    panel['state'] = 'disabled'
+
+
+def get_excess_lines(history_window, scrollback_lines):
+    line_count = history_window.line_count
+    # trim in bulk, not a line per message
+    if not scrollback_lines or line_count <= scrollback_lines * 1.1:
+        return 0
+    return line_count - scrollback_lines
 
 
-async def update_tk(root_frame, interval=1 / 120):
+async def trim_scrollback(panel, history_window, scrollback_lines):
+    """Trim the panel after the new messages are shown.
+
+    While the view is at the bottom the oldest lines are dropped. When the
+    user reads the earlier lines they are kept, and the panel stops
+    following the new messages once it doubles the limit.
+    """
+    excess_lines = get_excess_lines(history_window, scrollback_lines)
+    if not excess_lines:
+        return
+    _, last_visible_line = get_visible_lines(panel)
+    history = history_window.history
+    try:
+        if panel.yview()[1] >= 1:
+            await trim_panel_top(panel, history_window, excess_lines)
+        elif history_window.line_count > scrollback_lines * 2:
+            await trim_panel_bottom(
+                panel,
+                history_window,
+                max(scrollback_lines, last_visible_line)
+            )
+    except FileNotFoundError:
+        logger.warning(f'Can not open chat history: {history.filepath}.')
+
+
+def watch_scroll_edges(panel, history_window, history_requests_queue):
+    def on_scroll(first, last):
+        panel.vbar.set(first, last)
+        if history_window.is_loading:
+            return
+        history = history_window.history
+        is_history_start = history.is_start_position(
+            history_window.start_position
+        )
+        if float(first) <= 0 and not is_history_start:
+            history_window.is_loading = True
+            history_requests_queue.put_nowait((history_window, True))
+        elif float(last) >= 1 and not history_window.is_following():
+            history_window.is_loading = True
+            history_requests_queue.put_nowait((history_window, False))
+
+    panel['yscrollcommand'] = on_scroll
+
+
+def prepend_messages(panel, messages):
+    text = '\n'.join(message.strip() for message in messages)
+    panel['state'] = 'normal'
+    if panel.index('end-1c') != '1.0':
+        text += '\n'
+    panel.insert('1.0', text)
+    # keep the line the user was looking at on the top of the panel
+    panel.yview(f'{len(messages) + 1}.0')
+    panel['state'] = 'disabled'
+
+
+async def load_history_tail(panel, history_window, line_count):
+    history = history_window.history
+    try:
+        lines, start_position = await history.read_lines_before(
+            history.get_end_position(),
+            line_count
+        )
+    except FileNotFoundError:
+        logger.warning(f'Can not open chat history: {history.filepath}.')
+        return
+    history_window.prepend_lines(lines, start_position)
+    if lines:
+        display_messages(panel, lines)
+
+
+async def load_earlier_messages(panel, history_window, line_count,
+                                scrollback_lines):
+    history = history_window.history
+    lines, start_position = await history.read_lines_before(
+        history_window.start_position,
+        line_count
+    )
+    history_window.prepend_lines(lines, start_position)
+    if lines:
+        prepend_messages(panel, lines)
+    # the loaded lines are on the top, trim the opposite end
+    if get_excess_lines(history_window, scrollback_lines):
+        await trim_panel_bottom(panel, history_window, scrollback_lines)
+
+
+async def load_later_messages(panel, history_window, line_count,
+                              scrollback_lines):
+    history = history_window.history
+    lines, end_position = await history.read_lines_after(
+        history_window.end_position,
+        line_count
+    )
+    history_window.append_lines(lines, end_position)
+    if len(lines) < line_count:
+        # the history is over, show the new messages and follow them
+        messages = history_window.follow(end_position)
+        history_window.append_messages(messages)
+        lines += [str(message) for message in messages]
+    if lines:
+        display_messages(panel, lines, autoscroll=False)
+    # the loaded lines are on the bottom, trim the opposite end
+    excess_lines = get_excess_lines(history_window, scrollback_lines)
+    if excess_lines:
+        await trim_panel_top(panel, history_window, excess_lines)
+
+
+async def load_more_messages(panel, history_requests_queue, line_count,
+                             scrollback_lines=0):
+    while True:
+        history_window, is_earlier = await history_requests_queue.get()
+        history = history_window.history
+        try:
+            async with history_window.lock:
+                if is_earlier:
+                    await load_earlier_messages(
+                        panel,
+                        history_window,
+                        line_count,
+                        scrollback_lines
+                    )
+                else:
+                    await load_later_messages(
+                        panel,
+                        history_window,
+                        line_count,
+                        scrollback_lines
+                    )
+        except FileNotFoundError:
+            logger.warning(f'Can not open chat history: {history.filepath}.')
+        history_window.is_loading = False
+
+
+async def update_tk(root_frame, tk_pacer=None):
+    if tk_pacer is None:
+        tk_pacer = TkPacer()
+    tk_pacer.watch_input(root_frame)
     while True:
         try:
             root_frame.update()
         except tk.TclError:
             # if application has been destroyed/closed
             raise TkAppClosed()
-        await asyncio.sleep(interval)
+        await tk_pacer.wait()
 
 
-async def update_conversation_history(panel, messages_queue):
+async def update_conversation_history(
+        panel,
+        messages_queue,
+        history_window=None,
+        scrollback_lines=0,
+        max_batch_size=500,
+        tk_pacer=None,
+        frame_interval=1 / 60,
+):
     while True:
-        msg = await messages_queue.get()
-        display_message(panel, msg)
+        batch = [await messages_queue.get()]
+        while len(batch) < max_batch_size and not messages_queue.empty():
+            batch.append(messages_queue.get_nowait())
+        if history_window and not history_window.is_following():
+            # the panel shows them when the user scrolls down to them
+            async with history_window.lock:
+                history_window.add_pending_messages(batch)
+        else:
+            with metrics.time('render_batch_seconds'):
+                display_messages(panel, [str(message) for message in batch])
+            report_startup_step('startup_first_message_seconds')
+            metrics.counter('messages_rendered').increment(len(batch))
+            if history_window:
+                history_window.append_messages(batch)
+                async with history_window.lock:
+                    await trim_scrollback(
+                        panel,
+                        history_window,
+                        scrollback_lines
+                    )
+            if tk_pacer:
+                tk_pacer.notify()
+
+        # let the next lines pile up until the next frame
+        await asyncio.sleep(frame_interval)
+
+
+async def show_notifications(notification_banner, notifications_queue):
+    while True:
+        msg = await notifications_queue.get()
+        notification_banner.show(msg.title, msg.message, msg.is_warning)
 
 
-async def update_status_panel(status_labels, status_updates_queue):
+async def update_status_panel(
+        status_labels,
+        status_updates_queue,
+        notification_banner,
+):
     nickname_label, read_label, write_label = status_labels
 
     read_label['text'] = f'Чтение: нет соединения'
@@ -68,9 +567,65 @@ async def update_status_panel(status_labels, status_updates_queue):
         if isinstance(msg, SendingConnectionStateChanged):
             write_label['text'] = f'Отправка: {msg}'
 
+        if isinstance(msg, ReconnectScheduled):
+            if msg.state_class is ReadConnectionStateChanged:
+                read_label['text'] = f'Чтение: {msg}'
+            else:
+                write_label['text'] = f'Отправка: {msg}'
+
         if isinstance(msg, NicknameReceived):
             nickname_label['text'] = f'Имя пользователя: {msg.nickname}'
 
+        if isinstance(msg, ErrorOccurred):
+            notification_banner.show(msg.title, msg.message, msg.is_warning)
+
+
+def create_search_panel(root_frame, search_requests_queue):
+    search_frame = tk.Frame(root_frame)
+    search_frame.pack(side="top", fill=tk.X)
+
+    search_field = tk.Entry(search_frame)
+    search_field.pack(side="left", fill=tk.X, expand=True)
+    search_field.bind(
+        "<Return>",
+        lambda event: search_requests_queue.put_nowait(search_field.get())
+    )
+
+    search_button = tk.Button(search_frame)
+    search_button["text"] = "Найти в истории"
+    search_button["command"] = (
+        lambda: search_requests_queue.put_nowait(search_field.get())
+    )
+    search_button.pack(side="left")
+
+
+def show_search_results(root_frame, history, query, found_lines):
+    results_window = tk.Toplevel(root_frame)
+    results_window.title(f'Поиск: {query}')
+    results_panel = ScrolledText(results_window, wrap='none')
+    results_panel.pack(fill="both", expand=True)
+
+    results = [
+        f'{history.format_location(segment_number, offset)}: {text}'
+        for segment_number, offset, text in found_lines
+    ]
+    display_messages(results_panel, results or ['Ничего не найдено'])
+
+
+async def search_history(
+        root_frame,
+        history,
+        search_index,
+        search_requests_queue,
+):
+    while True:
+        query = await search_requests_queue.get()
+        with metrics.time('search_seconds'):
+            found_lines = await search_index.search(query)
+        if found_lines is None:
+            continue
+        show_search_results(root_frame, history, query, found_lines)
+
 
 def create_status_panel(root_frame):
     status_frame = tk.Frame(root_frame)
@@ -109,110 +664,191 @@ def create_status_panel(root_frame):
     return nickname_label, status_read_label, status_write_label
 
 
-async def handle_connection(
-        input_arguments,
-        messages_queue,
-        history_queue,
-        sending_queue,
-        status_updates_queue,
-):
-    server_host = input_arguments.host
-    sending_port = input_arguments.sending_port
-    token = input_arguments.token
-    reading_port = input_arguments.reading_port
-    while True:
-        try:
-            async with create_task_group() as task_group:
-                await task_group.spawn(
-                    read_msgs,
-                    messages_queue,
-                    history_queue,
-                    server_host,
-                    reading_port,
-                    status_updates_queue,
-                )
-                await task_group.spawn(
-                    send_messages,
-                    server_host,
-                    sending_port,
-                    sending_queue,
-                    token,
-                    status_updates_queue,
-                )
-                await task_group.spawn(
-                    watch_for_connection,
-                    server_host,
-                    sending_port,
-                    token
-                )
-        except ConnectionError:
-            continue
+def report_startup_step(histogram_name):
+    # only the first call is the startup
+    histogram = metrics.histogram(histogram_name)
+    if not histogram.count:
+        histogram.observe(time.monotonic() - metrics.start_time)
 
 
-async def draw(
-        input_arguments,
-        messages_queue,
-        history_queue,
-        sending_queue,
-        status_updates_queue,
-):
-    root = tk.Tk()
-
-    root.title('Чат Майнкрафтера')
+def draw_channel(channel_frame, channel):
+    status_labels = create_status_panel(channel_frame)
+    notification_banner = NotificationBanner(channel_frame)
 
-    root_frame = tk.Frame()
-    root_frame.pack(fill="both", expand=True)
+    if channel.sending_queue is not None:
+        input_frame = tk.Frame(channel_frame)
+        input_frame.pack(side="bottom", fill=tk.X)
 
-    status_labels = create_status_panel(root_frame)
+        input_field = tk.Entry(input_frame)
+        input_field.pack(side="left", fill=tk.X, expand=True)
 
-    input_frame = tk.Frame(root_frame)
-    input_frame.pack(side="bottom", fill=tk.X)
+        input_field.bind(
+            "<Return>",
+            lambda event: process_new_message(
+                input_field,
+                channel.sending_queue
+            )
+        )
 
-    input_field = tk.Entry(input_frame)
-    input_field.pack(side="left", fill=tk.X, expand=True)
+        send_button = tk.Button(input_frame)
+        send_button["text"] = "Отправить"
+        send_button["command"] = lambda: process_new_message(
+            input_field,
+            channel.sending_queue
+        )
+        send_button.pack(side="left")
 
-    input_field.bind(
-        "<Return>",
-        lambda event: process_new_message(input_field, sending_queue)
-    )
+    search_requests_queue = asyncio.Queue()
+    if channel.search_index_filepath:
+        create_search_panel(channel_frame, search_requests_queue)
 
-    send_button = tk.Button(input_frame)
-    send_button["text"] = "Отправить"
-    send_button["command"] = lambda: process_new_message(
-        input_field,
-        sending_queue
+    conversation_panel = ScrolledText(channel_frame, wrap='none')
+    conversation_panel.pack(side="top", fill="both", expand=True)
+    return (
+        status_labels,
+        notification_banner,
+        conversation_panel,
+        search_requests_queue,
     )
-    send_button.pack(side="left")
 
-    conversation_panel = ScrolledText(root_frame, wrap='none')
-    conversation_panel.pack(side="top", fill="both", expand=True)
 
-    history_filepath = input_arguments.history_filepath
-    try:
-        async with aiofiles.open(history_filepath, 'r') as file:
-            chat_history = await file.readlines()
-            [display_message(conversation_panel, msg) for msg in chat_history]
-    except FileNotFoundError:
-        logger.warning(f'Can not open chat history file: {history_filepath}.')
+async def run_channel(
+        input_arguments,
+        channel,
+        history,
+        seen_messages,
+        channel_frame,
+        channel_view,
+        tk_pacer,
+):
+    (
+        status_labels,
+        notification_banner,
+        conversation_panel,
+        search_requests_queue,
+    ) = channel_view
+    history_window = HistoryWindow(history)
+    history_requests_queue = asyncio.Queue()
+    if seen_messages:
+        await seen_messages.load_history_tail(history)
 
     async with create_task_group() as task_group:
-        await task_group.spawn(update_tk, root_frame)
+        await task_group.spawn(
+            update_status_panel,
+            status_labels,
+            channel.status_updates_queue,
+            notification_banner,
+        )
+
+        # the messages and the history writes wait in the queues, so the
+        # panel shows the history tail first and the new messages after it
+        await load_history_tail(
+            conversation_panel,
+            history_window,
+            input_arguments.history_chunk_lines
+        )
+        watch_scroll_edges(
+            conversation_panel,
+            history_window,
+            history_requests_queue
+        )
+
+        search_index = await save_channel_history(
+            input_arguments,
+            channel,
+            history,
+            task_group
+        )
+        if search_index:
+            await task_group.spawn(
+                search_history,
+                channel_frame,
+                history,
+                search_index,
+                search_requests_queue,
+            )
+
         await task_group.spawn(
             update_conversation_history,
             conversation_panel,
-            messages_queue
+            channel.messages_queue,
+            history_window,
+            input_arguments.scrollback_lines,
+            input_arguments.render_batch_size,
+            tk_pacer,
         )
         await task_group.spawn(
-            update_status_panel,
-            status_labels,
-            status_updates_queue
+            load_more_messages,
+            conversation_panel,
+            history_requests_queue,
+            input_arguments.history_chunk_lines,
+            input_arguments.scrollback_lines,
         )
+
+
+async def draw(input_arguments, channels):
+    async with create_task_group() as task_group:
         await task_group.spawn(
-            handle_connection,
-            input_arguments,
-            messages_queue,
-            history_queue,
-            sending_queue,
-            status_updates_queue
+            report_metrics,
+            input_arguments.metrics_interval,
+            input_arguments.metrics_filepath,
         )
-        await task_group.spawn(save_messages, history_filepath, history_queue)
+        # connect to the servers while the window is built
+        connections = []
+        for channel in channels:
+            connection = await connect_channel(
+                input_arguments,
+                channel,
+                task_group
+            )
+            connections.append(connection)
+        # let the connection tasks send the connection requests
+        await asyncio.sleep(0)
+
+        root = tk.Tk()
+
+        root.title('Чат Майнкрафтера')
+
+        root_frame = tk.Frame()
+        root_frame.pack(fill="both", expand=True)
+
+        notebook = None
+        if len(channels) > 1:
+            notebook = ttk.Notebook(root_frame)
+            notebook.pack(fill="both", expand=True)
+
+        channel_views = []
+        for channel, (history, seen_messages) in zip(channels, connections):
+            channel_frame = root_frame
+            if notebook:
+                channel_frame = tk.Frame(notebook)
+                notebook.add(channel_frame, text=channel.name)
+            channel_view = draw_channel(channel_frame, channel)
+            channel_views.append(
+                (channel, history, seen_messages, channel_frame, channel_view)
+            )
+
+        # show the window before the history is read
+        root_frame.update()
+        report_startup_step('startup_window_seconds')
+
+        tk_pacer = TkPacer(max_interval=input_arguments.tk_idle_interval)
+        # one Tk loop and one event loop serve all the channels
+        await task_group.spawn(update_tk, root_frame, tk_pacer)
+        for (
+                channel,
+                history,
+                seen_messages,
+                channel_frame,
+                channel_view,
+        ) in channel_views:
+            await task_group.spawn(
+                run_channel,
+                input_arguments,
+                channel,
+                history,
+                seen_messages,
+                channel_frame,
+                channel_view,
+                tk_pacer,
+            )
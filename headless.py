@@ -0,0 +1,72 @@
+import logging
+
+from anyio import create_task_group
+
+from metrics import report_metrics
+from process_messages import connect_channel, save_channel_history
+from statuses import ErrorOccurred, NicknameReceived
+from statuses import ReadConnectionStateChanged, ReconnectScheduled
+from statuses import SendingConnectionStateChanged
+
+logger = logging.getLogger('archiver')
+
+
+async def log_status_updates(channel_name, status_updates_queue):
+    while True:
+        msg = await status_updates_queue.get()
+        if isinstance(msg, ReadConnectionStateChanged):
+            logger.info(
+                f'{channel_name}: reading connection: {msg.name.lower()}'
+            )
+
+        if isinstance(msg, SendingConnectionStateChanged):
+            logger.info(
+                f'{channel_name}: sending connection: {msg.name.lower()}'
+            )
+
+        if isinstance(msg, ReconnectScheduled):
+            if msg.state_class is ReadConnectionStateChanged:
+                connection_name = 'reading'
+            else:
+                connection_name = 'sending'
+            logger.info(
+                f'{channel_name}: {connection_name} connection: attempt '
+                f'{msg.attempt_number} failed, reconnect in {msg.delay:.1f}s'
+            )
+
+        if isinstance(msg, NicknameReceived):
+            logger.info(f'{channel_name}: user name: {msg.nickname}')
+
+        if isinstance(msg, ErrorOccurred):
+            if msg.is_warning:
+                logger.warning(f'{channel_name}: {msg.title}: {msg.message}')
+            else:
+                logger.error(f'{channel_name}: {msg.title}: {msg.message}')
+
+
+async def archive_channel(input_arguments, channel, task_group):
+    await task_group.spawn(
+        log_status_updates,
+        channel.name,
+        channel.status_updates_queue
+    )
+    history, seen_messages = await connect_channel(
+        input_arguments,
+        channel,
+        task_group
+    )
+    if seen_messages:
+        await seen_messages.load_history_tail(history)
+    await save_channel_history(input_arguments, channel, history, task_group)
+
+
+async def archive(input_arguments, channels):
+    async with create_task_group() as task_group:
+        await task_group.spawn(
+            report_metrics,
+            input_arguments.metrics_interval,
+            input_arguments.metrics_filepath,
+        )
+        # all the channels share the event loop
+        for channel in channels:
+            await archive_channel(input_arguments, channel, task_group)
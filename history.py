@@ -0,0 +1,825 @@
+import asyncio
+from bisect import bisect_left, bisect_right
+import os
+import re
+import time
+import zlib
+
+import aiofiles
+from anyio import open_cancel_scope
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def split_lines(data):
+    raw_lines = [line + b'\n' for line in data.split(b'\n')]
+    raw_lines[-1] = raw_lines[-1][:-1]
+    if not raw_lines[-1]:
+        raw_lines.pop()
+    return raw_lines
+
+
+def decode_lines(raw_lines):
+    return [line.decode('utf-8', errors='replace') for line in raw_lines]
+
+
+def get_file_size(filepath):
+    try:
+        return os.path.getsize(filepath)
+    except FileNotFoundError:
+        return 0
+
+
+def truncate_file(filepath, size):
+    try:
+        os.truncate(filepath, size)
+    except OSError:
+        pass
+
+
+async def read_lines_before(filepath, offset, count):
+    """Read up to `count` lines ending at the byte `offset` of the file.
+
+    Return the lines and the offset of the first of them, so the next call
+    continues from where the previous one stopped.
+    """
+    if offset <= 0 or count <= 0:
+        return [], 0
+
+    async with aiofiles.open(filepath, 'rb') as file:
+        data = b''
+        start_offset = offset
+        while start_offset > 0 and data.count(b'\n') <= count:
+            chunk_size = min(READ_CHUNK_SIZE, start_offset)
+            start_offset -= chunk_size
+            await file.seek(start_offset)
+            data = await file.read(chunk_size) + data
+
+    raw_lines = split_lines(data)
+    if start_offset > 0:
+        # the first line is incomplete, the next call will read it
+        start_offset += len(raw_lines[0])
+        raw_lines = raw_lines[1:]
+    if len(raw_lines) > count:
+        start_offset += sum(len(line) for line in raw_lines[:-count])
+        raw_lines = raw_lines[-count:]
+    return decode_lines(raw_lines), start_offset
+
+
+async def skip_lines(filepath, offset, count):
+    """Skip up to `count` lines placed after the byte `offset` of the file.
+
+    Return the offset of the next line and the number of lines that could
+    not be skipped because the file is over.
+    """
+    async with aiofiles.open(filepath, 'rb') as file:
+        await file.seek(offset)
+        while count > 0:
+            chunk = await file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            line_end = -1
+            while count > 0:
+                line_end = chunk.find(b'\n', line_end + 1)
+                if line_end == -1:
+                    break
+                count -= 1
+            if count == 0:
+                return offset + line_end + 1, 0
+            offset += len(chunk)
+    return offset, count
+
+
+async def read_lines_after(filepath, offset, count):
+    """Read up to `count` complete lines starting at the byte `offset`.
+
+    Return the lines and the offset right after them.
+    """
+    if count <= 0:
+        return [], offset
+
+    async with aiofiles.open(filepath, 'rb') as file:
+        await file.seek(offset)
+        data = b''
+        while data.count(b'\n') < count:
+            chunk = await file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            data += chunk
+
+    raw_lines = split_lines(data)
+    if raw_lines and not raw_lines[-1].endswith(b'\n'):
+        # the line is being written
+        raw_lines.pop()
+    raw_lines = raw_lines[:count]
+    return decode_lines(raw_lines), offset + sum(map(len, raw_lines))
+
+
+async def iter_file_lines(filepath, offset=0, include_last_line=False):
+    """Yield the lines of the file placed after `offset` with their offsets.
+
+    The last line without a line break is still being written, it is
+    skipped unless `include_last_line` is set.
+    """
+    async with aiofiles.open(filepath, 'rb') as file:
+        await file.seek(offset)
+        remainder = b''
+        while True:
+            chunk = await file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                if remainder and include_last_line:
+                    yield offset, remainder.decode('utf-8', errors='replace')
+                break
+            raw_lines = split_lines(remainder + chunk)
+            remainder = b''
+            if not raw_lines[-1].endswith(b'\n'):
+                # the line continues in the next chunk
+                remainder = raw_lines.pop()
+            for raw_line in raw_lines:
+                yield offset, raw_line.decode('utf-8', errors='replace')
+                offset += len(raw_line)
+
+
+async def read_range(filepath, start_offset, end_offset=None):
+    async with aiofiles.open(filepath, 'rb') as file:
+        await file.seek(start_offset)
+        if end_offset is None:
+            data = await file.read()
+        else:
+            data = await file.read(end_offset - start_offset)
+    return decode_lines(split_lines(data))
+
+
+def decompress_blocks(data, max_count=None):
+    """Decompress the gzip members stored one after another.
+
+    A member cut by a crash in the middle of a write is skipped with
+    everything after it. Only the first `max_count` members are
+    decompressed if it is set.
+    """
+    chunks = []
+    while data and len(chunks) != max_count:
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        try:
+            chunk = decompressor.decompress(data)
+        except zlib.error:
+            break
+        if not decompressor.eof:
+            break
+        chunks.append(chunk)
+        data = decompressor.unused_data
+    return b''.join(chunks)
+
+
+class HistoryWriter:
+    """Keep the history file open and write the buffered lines by batches.
+
+    The buffer is flushed when it grows over `flush_size` characters or when
+    its oldest line waits longer than `flush_interval` seconds.
+    """
+    def __init__(self, filepath, flush_size=64 * 1024, flush_interval=1,
+                 fsync=False):
+        self.filepath = filepath
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.file = None
+        self.buffer = []
+        self.buffer_size = 0
+        self.buffer_start_time = None
+        self.buffer_start_timestamp = None
+        self.offset = 0
+        # the files and their sizes before the running write
+        self.written_file_sizes = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        async with open_cancel_scope(shield=True):
+            try:
+                await self.flush()
+            finally:
+                await self.close()
+
+    def add(self, line):
+        if not self.buffer:
+            self.buffer_start_time = time.monotonic()
+            self.buffer_start_timestamp = time.time()
+        self.buffer.append(line)
+        self.buffer_size += len(line)
+
+    def get_flush_timeout(self):
+        if not self.buffer:
+            return None
+        flush_time = self.buffer_start_time + self.flush_interval
+        return max(flush_time - time.monotonic(), 0)
+
+    def is_flush_due(self):
+        if self.buffer_size >= self.flush_size:
+            return True
+        return self.buffer and self.get_flush_timeout() == 0
+
+    async def flush(self):
+        """Write the buffered lines.
+
+        Return the written lines with their segment numbers and offsets. If
+        the write fails the lines stay in the buffer for the next flush.
+        """
+        if not self.buffer:
+            return []
+        lines = self.buffer[:]
+        raw_lines = [line.encode('utf-8', errors='replace') for line in lines]
+        timestamp = self.buffer_start_timestamp
+        self.written_file_sizes = []
+        try:
+            segment_number, offset = await self.write(
+                b''.join(raw_lines),
+                timestamp
+            )
+        except OSError:
+            await self.close()
+            # the batch is written again, drop the part of it in the files
+            for filepath, file_size in self.written_file_sizes:
+                truncate_file(filepath, file_size)
+            raise
+        del self.buffer[:len(lines)]
+        self.buffer_size -= sum(len(line) for line in lines)
+
+        written_lines = []
+        for line, raw_line in zip(lines, raw_lines):
+            written_lines.append((segment_number, offset, line))
+            offset += len(raw_line)
+        return written_lines
+
+    async def open_file(self, filepath):
+        return await aiofiles.open(filepath, 'ab')
+
+    async def sync_file(self, file):
+        await file.flush()
+        if self.fsync:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, os.fsync, file.fileno())
+
+    async def write(self, data, timestamp):
+        if self.file is None:
+            self.file = await self.open_file(self.filepath)
+            self.offset = get_file_size(self.filepath)
+        self.written_file_sizes = [(self.filepath, self.offset)]
+        await self.file.write(data)
+        await self.sync_file(self.file)
+        offset = self.offset
+        self.offset += len(data)
+        return 0, offset
+
+    async def close(self):
+        if self.file is None:
+            return
+        file, self.file = self.file, None
+        try:
+            await file.close()
+        except OSError:
+            pass
+
+
+class SegmentedHistoryWriter(HistoryWriter):
+    def __init__(self, history, flush_size=64 * 1024, flush_interval=1,
+                 fsync=False):
+        super().__init__(history.filepath, flush_size, flush_interval, fsync)
+        self.history = history
+        self.segment_number = None
+        self.segment_size = 0
+        self.index_file = None
+
+    async def open_segment(self, segment_number):
+        await self.close()
+        filepath = self.history.get_segment_path(segment_number)
+        self.file = await self.open_file(filepath)
+        self.index_file = await self.open_file(f'{filepath}.idx')
+        self.segment_number = segment_number
+        self.segment_size = get_file_size(filepath)
+        self.history.refresh_segments()
+
+    async def write(self, data, timestamp):
+        if self.file is None:
+            segment_numbers = self.history.get_segment_numbers()
+            last_number = segment_numbers[-1] if segment_numbers else 0
+            await self.open_segment(last_number)
+        if self.segment_size >= self.history.segment_size:
+            await self.open_segment(self.segment_number + 1)
+            self.history.remove_old_segments()
+
+        offset = self.segment_size
+        index_entry = f'{timestamp:.3f} {offset}\n'
+        segment_path = self.history.get_segment_path(self.segment_number)
+        self.written_file_sizes = [
+            (segment_path, offset),
+            (f'{segment_path}.idx', get_file_size(f'{segment_path}.idx')),
+        ]
+        await self.file.write(data)
+        await self.sync_file(self.file)
+        self.segment_size += len(data)
+        await self.index_file.write(index_entry.encode())
+        await self.sync_file(self.index_file)
+        return self.segment_number, offset
+
+    async def close(self):
+        await super().close()
+        if self.index_file is None:
+            return
+        index_file, self.index_file = self.index_file, None
+        try:
+            await index_file.close()
+        except OSError:
+            pass
+
+
+class CompressedHistoryWriter(HistoryWriter):
+    def __init__(self, history, flush_size=64 * 1024, flush_interval=1,
+                 fsync=False):
+        super().__init__(history.filepath, flush_size, flush_interval, fsync)
+        self.history = history
+        self.index_file = None
+
+    async def write(self, data, timestamp):
+        if self.file is None:
+            self.file = await self.open_file(self.filepath)
+            self.index_file = await self.open_file(self.history.index_path)
+            self.offset = get_file_size(self.filepath)
+
+        block_offset = self.offset
+        compressor = zlib.compressobj(
+            self.history.compresslevel,
+            zlib.DEFLATED,
+            zlib.MAX_WBITS | 16,
+        )
+        block = compressor.compress(data) + compressor.flush()
+        index_entry = f'{timestamp:.3f} {block_offset}\n'
+        self.written_file_sizes = [
+            (self.filepath, block_offset),
+            (self.history.index_path, get_file_size(self.history.index_path)),
+        ]
+        await self.file.write(block)
+        await self.sync_file(self.file)
+        self.offset += len(block)
+        await self.index_file.write(index_entry.encode())
+        await self.sync_file(self.index_file)
+        return block_offset, 0
+
+    async def close(self):
+        await super().close()
+        if self.index_file is None:
+            return
+        index_file, self.index_file = self.index_file, None
+        try:
+            await index_file.close()
+        except OSError:
+            pass
+
+
+class PlainHistory:
+    """The chat history stored as one append-only text file.
+
+    A position in the history is a byte offset in the file.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+    def create_writer(self, flush_size, flush_interval, fsync):
+        return HistoryWriter(self.filepath, flush_size, flush_interval, fsync)
+
+    def get_segments(self):
+        return [(0, self.filepath)]
+
+    def get_segment_path(self, segment_number):
+        return self.filepath
+
+    def get_start_position(self):
+        return 0
+
+    def get_end_position(self):
+        return get_file_size(self.filepath)
+
+    def is_start_position(self, position):
+        return position <= 0
+
+    def get_position(self, segment_number, offset):
+        return offset
+
+    def format_location(self, segment_number, offset):
+        return f'{self.filepath}:{offset}'
+
+    async def read_lines_before(self, position, count):
+        return await read_lines_before(self.filepath, position, count)
+
+    async def skip_lines(self, position, count):
+        position, _ = await skip_lines(self.filepath, position, count)
+        return position
+
+    async def read_lines_after(self, position, count):
+        return await read_lines_after(self.filepath, position, count)
+
+    async def iter_lines(self, segment_number=0, offset=0):
+        async for line_offset, line in iter_file_lines(self.filepath, offset):
+            yield 0, line_offset, line
+
+
+class SegmentedHistory:
+    """The chat history stored as numbered segment files.
+
+    Each segment `<filepath>.000001` has a sidecar index file
+    `<filepath>.000001.idx` whose lines map the write time of a batch of
+    messages to its byte offset, so a time range query reads only the
+    segments covering it. A new segment is started when the current one
+    grows over `segment_size` bytes and only the last `max_segments`
+    segments are kept. The segment list is read from the directory once and
+    the writer refreshes it when it starts or removes a segment.
+
+    A position in the history is a pair of a segment number and a byte offset.
+    """
+    def __init__(self, filepath, segment_size=16 * 1024 * 1024,
+                 max_segments=0):
+        self.filepath = filepath
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.segment_numbers = None
+
+    def create_writer(self, flush_size, flush_interval, fsync):
+        return SegmentedHistoryWriter(self, flush_size, flush_interval, fsync)
+
+    def get_segment_path(self, segment_number):
+        return f'{self.filepath}.{segment_number:06d}'
+
+    def refresh_segments(self):
+        directory, basename = os.path.split(os.path.abspath(self.filepath))
+        segment_name_pattern = re.compile(rf'{re.escape(basename)}\.(\d+)')
+        try:
+            filenames = os.listdir(directory)
+        except FileNotFoundError:
+            filenames = []
+        segment_numbers = []
+        for filename in filenames:
+            match = segment_name_pattern.fullmatch(filename)
+            if match:
+                segment_numbers.append(int(match.group(1)))
+        self.segment_numbers = sorted(segment_numbers)
+
+    def get_segment_numbers(self):
+        # the window asks for the history start on every scroll event
+        if self.segment_numbers is None:
+            self.refresh_segments()
+        return self.segment_numbers
+
+    def get_segments(self):
+        return [
+            (segment_number, self.get_segment_path(segment_number))
+            for segment_number in self.get_segment_numbers()
+        ]
+
+    def remove_old_segments(self):
+        if not self.max_segments:
+            return
+        segment_numbers = self.get_segment_numbers()
+        for segment_number in segment_numbers[:-self.max_segments]:
+            segment_path = self.get_segment_path(segment_number)
+            for filepath in (segment_path, f'{segment_path}.idx'):
+                try:
+                    os.remove(filepath)
+                except FileNotFoundError:
+                    pass
+        self.refresh_segments()
+
+    def get_start_position(self):
+        segment_numbers = self.get_segment_numbers()
+        if not segment_numbers:
+            return 0, 0
+        return segment_numbers[0], 0
+
+    def get_end_position(self):
+        segment_numbers = self.get_segment_numbers()
+        if not segment_numbers:
+            return 0, 0
+        last_number = segment_numbers[-1]
+        return last_number, get_file_size(self.get_segment_path(last_number))
+
+    def is_start_position(self, position):
+        return position <= self.get_start_position()
+
+    def get_position(self, segment_number, offset):
+        return segment_number, offset
+
+    def format_location(self, segment_number, offset):
+        return f'{self.get_segment_path(segment_number)}:{offset}'
+
+    async def read_lines_before(self, position, count):
+        segment_numbers = self.get_segment_numbers()
+        if not segment_numbers:
+            return [], position
+        segment_number, offset = max(position, self.get_start_position())
+        lines = []
+        while True:
+            segment_path = self.get_segment_path(segment_number)
+            if segment_number in segment_numbers:
+                segment_lines, offset = await read_lines_before(
+                    segment_path,
+                    offset,
+                    count - len(lines)
+                )
+                lines = segment_lines + lines
+            if len(lines) >= count or segment_number <= segment_numbers[0]:
+                return lines, (segment_number, offset)
+            segment_number -= 1
+            offset = get_file_size(self.get_segment_path(segment_number))
+
+    async def skip_lines(self, position, count):
+        segment_numbers = self.get_segment_numbers()
+        segment_number, offset = max(position, self.get_start_position())
+        while segment_number in segment_numbers:
+            offset, count = await skip_lines(
+                self.get_segment_path(segment_number),
+                offset,
+                count
+            )
+            if not count or segment_number == segment_numbers[-1]:
+                break
+            segment_number += 1
+            offset = 0
+        return segment_number, offset
+
+    async def read_lines_after(self, position, count):
+        segment_numbers = self.get_segment_numbers()
+        segment_number, offset = max(position, self.get_start_position())
+        lines = []
+        while segment_number in segment_numbers:
+            segment_lines, offset = await read_lines_after(
+                self.get_segment_path(segment_number),
+                offset,
+                count - len(lines)
+            )
+            lines += segment_lines
+            if len(lines) >= count or segment_number == segment_numbers[-1]:
+                break
+            segment_number += 1
+            offset = 0
+        return lines, (segment_number, offset)
+
+    async def iter_lines(self, segment_number=0, offset=0):
+        for number, segment_path in self.get_segments():
+            if number < segment_number:
+                continue
+            start_offset = offset if number == segment_number else 0
+            try:
+                async for line_offset, line in iter_file_lines(
+                        segment_path,
+                        start_offset
+                ):
+                    yield number, line_offset, line
+            except FileNotFoundError:
+                # the segment is removed as too old
+                continue
+
+    async def read_index(self, segment_number):
+        index_path = f'{self.get_segment_path(segment_number)}.idx'
+        timestamps, offsets = [], []
+        try:
+            async with aiofiles.open(index_path, 'r') as index_file:
+                async for index_entry in index_file:
+                    timestamp, offset = index_entry.split()
+                    timestamps.append(float(timestamp))
+                    offsets.append(int(offset))
+        except (FileNotFoundError, ValueError):
+            pass
+        return timestamps, offsets
+
+    async def read_first_timestamp(self, segment_number):
+        index_path = f'{self.get_segment_path(segment_number)}.idx'
+        try:
+            async with aiofiles.open(index_path, 'r') as index_file:
+                timestamp, _ = (await index_file.readline()).split()
+        except (FileNotFoundError, ValueError):
+            return None
+        return float(timestamp)
+
+    async def find_segment(self, segment_numbers, timestamp):
+        # binary search of the last segment started before the timestamp
+        low, high = 0, len(segment_numbers)
+        while high - low > 1:
+            middle = (low + high) // 2
+            first_timestamp = await self.read_first_timestamp(
+                segment_numbers[middle]
+            )
+            if first_timestamp is not None and first_timestamp > timestamp:
+                high = middle
+            else:
+                low = middle
+        return low
+
+    async def read_time_range(self, start_time, end_time):
+        """Read the messages written from `start_time` till `end_time`.
+
+        The precision is limited by the index: each entry marks a batch of
+        messages written at once.
+        """
+        segment_numbers = self.get_segment_numbers()
+        if not segment_numbers:
+            return []
+        first_segment = await self.find_segment(segment_numbers, start_time)
+        lines = []
+        for segment_number in segment_numbers[first_segment:]:
+            timestamps, offsets = await self.read_index(segment_number)
+            if not timestamps or timestamps[0] > end_time:
+                break
+            first_entry = max(bisect_right(timestamps, start_time) - 1, 0)
+            last_entry = bisect_right(timestamps, end_time)
+            end_offset = None
+            if last_entry < len(offsets):
+                end_offset = offsets[last_entry]
+            lines += await read_range(
+                self.get_segment_path(segment_number),
+                offsets[first_entry],
+                end_offset
+            )
+            if end_offset is not None:
+                break
+        return lines
+
+
+class CompressedHistory:
+    """The chat history stored as a file of gzip compressed blocks.
+
+    Every flush of the writer appends a gzip member, so a block is
+    decompressed without the blocks before it and the whole file is still
+    readable by gzip. The sidecar index file `<filepath>.idx` keeps the
+    write time and the byte offset of every block.
+
+    A position in the history is a pair of a block offset in the file and a
+    byte offset in the decompressed block.
+    """
+    def __init__(self, filepath, compresslevel=6):
+        self.filepath = filepath
+        self.index_path = f'{filepath}.idx'
+        self.compresslevel = compresslevel
+        self.cached_block = None
+        # the index only grows, the entries read are kept with its size
+        self.block_offsets = []
+        self.index_size_read = 0
+
+    def create_writer(self, flush_size, flush_interval, fsync):
+        return CompressedHistoryWriter(
+            self,
+            flush_size,
+            flush_interval,
+            fsync
+        )
+
+    def get_segments(self):
+        return [(0, self.filepath)]
+
+    def get_segment_path(self, segment_number):
+        return self.filepath
+
+    def get_start_position(self):
+        return 0, 0
+
+    def get_end_position(self):
+        return get_file_size(self.filepath), 0
+
+    def is_start_position(self, position):
+        return position <= (0, 0)
+
+    def get_position(self, block_offset, offset):
+        return block_offset, offset
+
+    def format_location(self, block_offset, offset):
+        # an offset in a decompressed block points nowhere in the file
+        return self.filepath
+
+    async def read_block_offsets(self):
+        if get_file_size(self.index_path) < self.index_size_read:
+            # the index was cut after a failed write, read it again
+            self.block_offsets = []
+            self.index_size_read = 0
+        try:
+            async with aiofiles.open(self.index_path, 'rb') as index_file:
+                await index_file.seek(self.index_size_read)
+                new_entries = await index_file.read()
+        except FileNotFoundError:
+            new_entries = b''
+        for index_entry in split_lines(new_entries):
+            if not index_entry.endswith(b'\n'):
+                # the writer has not finished the entry yet
+                break
+            try:
+                _, block_offset = index_entry.split()
+                self.block_offsets.append(int(block_offset))
+            except ValueError:
+                break
+            self.index_size_read += len(index_entry)
+        if not self.block_offsets and get_file_size(self.filepath):
+            # without the index the file is read as one block
+            return [0]
+        return self.block_offsets
+
+    async def read_block(self, block_offsets, block_offset):
+        block_index = bisect_right(block_offsets, block_offset)
+        end_offset = None
+        if block_index < len(block_offsets):
+            end_offset = block_offsets[block_index]
+        # scrolling reads the lines of the same block a few times in a row
+        if self.cached_block and self.cached_block[0] == (
+                block_offset,
+                end_offset
+        ):
+            return self.cached_block[1]
+
+        async with aiofiles.open(self.filepath, 'rb') as file:
+            await file.seek(block_offset)
+            if end_offset is None:
+                compressed_data = await file.read()
+            else:
+                compressed_data = await file.read(end_offset - block_offset)
+        max_count = None
+        if end_offset is None and get_file_size(self.index_path):
+            # a block appended after the index was read is not in it yet,
+            # its lines would be read again from the next block
+            max_count = 1
+        data = decompress_blocks(compressed_data, max_count)
+        self.cached_block = (block_offset, end_offset), data
+        return data
+
+    async def read_lines_before(self, position, count):
+        block_offsets = await self.read_block_offsets()
+        block_offset, offset = position
+        raw_lines = []
+        while len(raw_lines) < count:
+            if offset == 0:
+                # continue from the end of the previous block
+                block_index = bisect_left(block_offsets, block_offset) - 1
+                if block_index < 0:
+                    break
+                block_offset = block_offsets[block_index]
+                offset = None
+            data = await self.read_block(block_offsets, block_offset)
+            if offset is None:
+                offset = len(data)
+            block_lines = split_lines(data[:offset])
+            block_lines = block_lines[-(count - len(raw_lines)):]
+            offset -= sum(len(line) for line in block_lines)
+            raw_lines = block_lines + raw_lines
+        return decode_lines(raw_lines), (block_offset, offset)
+
+    async def skip_lines(self, position, count):
+        block_offsets = await self.read_block_offsets()
+        block_offset, offset = position
+        while block_offsets:
+            data = await self.read_block(block_offsets, block_offset)
+            while count > 0:
+                line_end = data.find(b'\n', offset)
+                if line_end == -1:
+                    break
+                offset = line_end + 1
+                count -= 1
+            block_index = bisect_right(block_offsets, block_offset)
+            if not count or block_index >= len(block_offsets):
+                break
+            block_offset, offset = block_offsets[block_index], 0
+        return block_offset, offset
+
+    async def read_lines_after(self, position, count):
+        block_offsets = await self.read_block_offsets()
+        block_offset, offset = position
+        raw_lines = []
+        while block_offsets and len(raw_lines) < count:
+            data = await self.read_block(block_offsets, block_offset)
+            block_lines = split_lines(data[offset:])[:count - len(raw_lines)]
+            offset += sum(map(len, block_lines))
+            raw_lines += block_lines
+            block_index = bisect_right(block_offsets, block_offset)
+            if len(raw_lines) >= count or block_index >= len(block_offsets):
+                break
+            block_offset, offset = block_offsets[block_index], 0
+        return decode_lines(raw_lines), (block_offset, offset)
+
+    async def iter_lines(self, segment_number=0, offset=0):
+        block_offsets = await self.read_block_offsets()
+        for block_offset in block_offsets:
+            if block_offset < segment_number:
+                continue
+            data = await self.read_block(block_offsets, block_offset)
+            line_offset = 0
+            for raw_line in split_lines(data):
+                if not raw_line.endswith(b'\n'):
+                    break
+                if (block_offset, line_offset) >= (segment_number, offset):
+                    line = raw_line.decode('utf-8', errors='replace')
+                    yield block_offset, line_offset, line
+                line_offset += len(raw_line)
+
+
+def open_history(filepath, history_format='plain',
+                 segment_size=16 * 1024 * 1024, max_segments=0):
+    if history_format == 'segmented':
+        return SegmentedHistory(filepath, segment_size, max_segments)
+    if history_format == 'compressed':
+        return CompressedHistory(filepath)
+    return PlainHistory(filepath)
@@ -0,0 +1,52 @@
+"""Print the chat messages written to a segmented history in a time range.
+
+    $ python history_range.py chat.txt --start "2021-06-18 12:00"
+
+The times are local, the range ends now unless `--end` is given. The
+segmented history keeps the write time of every batch of messages, so only
+the segments covering the range are read. A batch written around the range
+start is printed whole.
+"""
+import argparse
+import asyncio
+from datetime import datetime
+import sys
+
+from history import SegmentedHistory
+
+
+def parse_time(time_text):
+    try:
+        return datetime.fromisoformat(time_text).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f'"{time_text}" is not like 2021-06-18 12:00'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'history_filepath',
+        help='The --history_filepath the client writes the segments to.'
+    )
+    parser.add_argument('--start', type=parse_time, default=0)
+    parser.add_argument(
+        '--end',
+        type=parse_time,
+        default=float('inf'),
+        help='The end of the range, now by default.'
+    )
+    arguments = parser.parse_args()
+
+    history = SegmentedHistory(arguments.history_filepath)
+    if not history.get_segment_numbers():
+        sys.exit(f'No history segments found for {arguments.history_filepath}')
+    lines = asyncio.run(
+        history.read_time_range(arguments.start, arguments.end)
+    )
+    sys.stdout.writelines(lines)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Write the log records from a background thread.
+
+A console write can block the event loop, so the loggers only put the
+records to a bounded queue and a listener thread formats and writes them.
+"""
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import time
+
+from metrics import metrics
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most `rate` records a second below the WARNING level.
+
+    The warnings and errors always pass. The dropped records are counted in
+    the `log_records_dropped` metric.
+    """
+    def __init__(self, rate, burst=None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.last_time = time.monotonic()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rate:
+            return True
+        now = time.monotonic()
+        self.tokens = min(
+            self.burst,
+            self.tokens + (now - self.last_time) * self.rate
+        )
+        self.last_time = now
+        if self.tokens < 1:
+            metrics.counter('log_records_dropped').increment()
+            return False
+        self.tokens -= 1
+        return True
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """Put the records to the queue as they are.
+
+    QueueHandler formats the message before putting the record, here the
+    listener thread does it, so the record arguments should not be changed
+    after the logging call. When the queue is full the record is dropped
+    instead of waiting for the console.
+    """
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.counter('log_records_dropped').increment()
+
+
+class BackgroundQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # wait for a free slot, the sentinel must not be dropped
+        self.queue.put(self._sentinel)
+
+
+class LoggerFormatter(logging.Formatter):
+    """Format a record with the formatter of its logger."""
+    def __init__(self, formatters, default_formatter=None):
+        super().__init__()
+        self.formatters = formatters
+        self.default_formatter = default_formatter or logging.Formatter()
+
+    def format(self, record):
+        formatter = self.formatters.get(record.name, self.default_formatter)
+        return formatter.format(record)
+
+
+def start_logging(logger_settings, rate_limited_loggers=(),
+                  max_records_per_second=100, max_queued_records=10000,
+                  level=logging.WARNING):
+    """Send all the loggers to the console through a background thread.
+
+    `logger_settings` maps a logger name to its level and formatter, the
+    other loggers write the records of `level` and above in the default
+    format. Only the records of `rate_limited_loggers`, the ones logging
+    every message, are limited to `max_records_per_second`. Return the
+    started listener, stopping it writes the queued records.
+    """
+    records_queue = queue.Queue(max_queued_records)
+    queue_handler = BackgroundQueueHandler(records_queue)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(queue_handler)
+
+    formatters = {}
+    for logger_name, (logger_level, formatter) in logger_settings.items():
+        logger = logging.getLogger(logger_name)
+        logger.setLevel(logger_level)
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+        formatters[logger_name] = formatter
+
+    # the limited loggers share the rate
+    rate_limit_filter = RateLimitFilter(max_records_per_second)
+    for logger_name in rate_limited_loggers:
+        logging.getLogger(logger_name).addFilter(rate_limit_filter)
+
+    console = logging.StreamHandler()
+    console.setFormatter(LoggerFormatter(
+        formatters,
+        logging.Formatter('%(levelname)s:%(name)s:%(message)s')
+    ))
+    listener = BackgroundQueueListener(records_queue, console)
+    listener.start()
+    return listener
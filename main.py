@@ -1,9 +1,16 @@
 import asyncio
 import logging
 
+from anyio import ExceptionGroup
 import configargparse
 
-from gui import draw, TkAppClosed
+from channels import Channel, get_channel_filepath, MAIN_CHANNEL_NAME
+from channels import parse_channel_spec
+from logs import start_logging
+from messages import ChatMessage
+from metrics import metrics
+from open_connection import ConnectionAttemptsExceeded
+from queues import DropOldestQueue, SkippingQueue
 
 logger = logging.getLogger(__file__)
 
@@ -48,6 +55,19 @@ def get_input_arguments():
         the script will create a new user having this name.
         """
     )
+    argument_parser.add(
+        '--channel',
+        dest='channels',
+        action='append',
+        default=[],
+        env_var='CHAT_CHANNELS',
+        help="""
+        One more chat to monitor in the same window, like
+        name=host:reading_port. Repeat the argument for several chats. The
+        history of the chat is saved next to the main one, in
+        chat_history.name.txt.
+        """
+    )
     argument_parser.add(
         '--history_filepath',
         type=str,
@@ -55,54 +75,406 @@ def get_input_arguments():
         env_var='HISTORY_FILEPATH',
         help='A file path where script should output result.'
     )
+    argument_parser.add(
+        '--headless',
+        action='store_true',
+        env_var='HEADLESS',
+        help='Only save the chat history, without the chat window.'
+    )
+    argument_parser.add(
+        '--history_format',
+        choices=['plain', 'segmented', 'compressed'],
+        default='plain',
+        env_var='HISTORY_FORMAT',
+        help="""
+        'plain' keeps the history in one text file, 'segmented' splits it
+        into numbered segment files indexed by the message time,
+        'compressed' keeps it in one file of gzip compressed blocks.
+        """
+    )
+    argument_parser.add(
+        '--history_segment_size',
+        type=int,
+        default=16 * 1024 * 1024,
+        env_var='HISTORY_SEGMENT_SIZE',
+        help='Size in bytes of a segmented history file to start a new one.'
+    )
+    argument_parser.add(
+        '--history_max_segments',
+        type=int,
+        default=0,
+        env_var='HISTORY_MAX_SEGMENTS',
+        help='Number of the history segments to keep. Zero means all.'
+    )
+    argument_parser.add(
+        '--history_flush_size',
+        type=int,
+        default=64 * 1024,
+        env_var='HISTORY_FLUSH_SIZE',
+        help='Number of buffered characters to write to the history file.'
+    )
+    argument_parser.add(
+        '--history_flush_interval',
+        type=float,
+        default=1,
+        env_var='HISTORY_FLUSH_INTERVAL',
+        help='Max number of seconds a message waits to be written to history.'
+    )
+    argument_parser.add(
+        '--history_fsync',
+        action='store_true',
+        env_var='HISTORY_FSYNC',
+        help='Sync the history file to the disk after each write.'
+    )
+    argument_parser.add(
+        '--dedup_window_size',
+        type=int,
+        default=1000,
+        env_var='DEDUP_WINDOW_SIZE',
+        help="""
+        Number of the last messages remembered to drop the messages the
+        server sends again after a reconnect. Zero turns it off.
+        """
+    )
+    argument_parser.add(
+        '--search_index_filepath',
+        type=str,
+        default='',
+        env_var='SEARCH_INDEX_FILEPATH',
+        help="""
+        A file path of the history full-text search index. The search is
+        disabled if the path is not set.
+        """
+    )
+    argument_parser.add(
+        '--session_trace_filepath',
+        type=str,
+        default='',
+        env_var='SESSION_TRACE_FILEPATH',
+        help="""
+        A file to record the received and sent chat traffic to, it can be
+        replayed by benchmarks.replay. Nothing is recorded if the path is
+        not set.
+        """
+    )
+    argument_parser.add(
+        '--history_chunk_lines',
+        type=int,
+        default=500,
+        env_var='HISTORY_CHUNK_LINES',
+        help="""
+        Number of the last history lines shown on startup. The earlier lines
+        are loaded by chunks of the same size when the chat is scrolled up.
+        """
+    )
+    argument_parser.add(
+        '--scrollback_lines',
+        type=int,
+        default=2000,
+        env_var='SCROLLBACK_LINES',
+        help="""
+        Max number of lines the chat window keeps, the other lines are read
+        from the history file when the chat is scrolled to them. Zero means
+        no limit.
+        """
+    )
+    argument_parser.add(
+        '--tk_idle_interval',
+        type=float,
+        default=0.1,
+        env_var='TK_IDLE_INTERVAL',
+        help="""
+        Seconds between window updates while the chat is idle, the input to
+        an idle window is noticed up to this late.
+        """
+    )
+    argument_parser.add(
+        '--render_batch_size',
+        type=int,
+        default=500,
+        env_var='RENDER_BATCH_SIZE',
+        help='Max number of messages the chat window renders per frame.'
+    )
+    argument_parser.add(
+        '--connect_timeout',
+        type=float,
+        default=10,
+        env_var='CONNECT_TIMEOUT',
+        help='Seconds to wait for a connection to the chat server.'
+    )
+    argument_parser.add(
+        '--reconnect_max_delay',
+        type=float,
+        default=30,
+        env_var='RECONNECT_MAX_DELAY',
+        help='Max seconds between the attempts to connect to the server.'
+    )
+    argument_parser.add(
+        '--reconnect_max_attempts',
+        type=int,
+        default=0,
+        env_var='RECONNECT_MAX_ATTEMPTS',
+        help="""
+        Number of failed attempts in a row to connect before the client
+        stops, a connection dropped before the server answers counts as
+        failed. Zero means the client retries forever.
+        """
+    )
+    argument_parser.add(
+        '--ping_interval',
+        type=float,
+        default=10,
+        env_var='PING_INTERVAL',
+        help='Seconds of silence before the client checks the connection.'
+    )
+    argument_parser.add(
+        '--ping_timeout',
+        type=float,
+        default=5,
+        env_var='PING_TIMEOUT',
+        help='Seconds to wait for the server answer to consider it alive.'
+    )
+    argument_parser.add(
+        '--max_messages_in_flight',
+        type=int,
+        default=10,
+        env_var='MAX_MESSAGES_IN_FLIGHT',
+        help='Number of messages the client sends before the server answers.'
+    )
+    argument_parser.add(
+        '--max_messages_per_second',
+        type=float,
+        default=0,
+        env_var='MAX_MESSAGES_PER_SECOND',
+        help="""
+        Max sending rate to follow the server flood limits. Zero, the
+        default, means no limit, the messages are sent as fast as the server
+        answers them within --max_messages_in_flight.
+        """
+    )
+    argument_parser.add(
+        '--messages_queue_size',
+        type=int,
+        default=10000,
+        env_var='MESSAGES_QUEUE_SIZE',
+        help="""
+        Number of messages waiting to be shown in the chat window. The extra
+        messages are skipped and only saved to the history.
+        """
+    )
+    argument_parser.add(
+        '--history_queue_size',
+        type=int,
+        default=10000,
+        env_var='HISTORY_QUEUE_SIZE',
+        help="""
+        Number of messages waiting to be saved to the history. When the
+        queue is full the client stops reading the chat until it is saved.
+        """
+    )
+    argument_parser.add(
+        '--status_queue_size',
+        type=int,
+        default=100,
+        env_var='STATUS_QUEUE_SIZE',
+        help='Number of status updates kept, the oldest ones are dropped.'
+    )
+    argument_parser.add(
+        '--metrics_interval',
+        type=float,
+        default=60,
+        env_var='METRICS_INTERVAL',
+        help='Seconds between the metrics log lines. Zero disables metrics.'
+    )
+    argument_parser.add(
+        '--log_level',
+        type=str.upper,
+        default='DEBUG',
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+        env_var='LOG_LEVEL',
+        help="""
+        The level of the log, the metrics and the archiver lines are written
+        anyway. INFO and above skip the per message lines.
+        """
+    )
+    argument_parser.add(
+        '--max_log_records_per_second',
+        type=int,
+        default=100,
+        env_var='MAX_LOG_RECORDS_PER_SECOND',
+        help="""
+        Number of the connection log records below WARNING written in a
+        second, the rest are dropped and counted in the metrics. Zero means
+        no limit.
+        """
+    )
+    argument_parser.add(
+        '--metrics_filepath',
+        type=str,
+        default='',
+        env_var='METRICS_FILEPATH',
+        help='A JSON file the script should dump the metrics to.'
+    )
     input_arguments = argument_parser.parse_args()
     return input_arguments
 
 
+def create_channels(input_arguments):
+    main_channel = Channel(
+        MAIN_CHANNEL_NAME,
+        input_arguments.host,
+        input_arguments.reading_port,
+        input_arguments.sending_port,
+        input_arguments.token,
+        input_arguments.history_filepath,
+        input_arguments.search_index_filepath,
+        input_arguments.session_trace_filepath,
+    )
+    channels = [main_channel]
+    for channel_spec in input_arguments.channels:
+        name, host, reading_port = parse_channel_spec(channel_spec)
+        if name in [channel.name for channel in channels]:
+            raise ValueError(f'The channel name "{name}" is repeated')
+        channels.append(Channel(
+            name,
+            host,
+            reading_port,
+            history_filepath=get_channel_filepath(
+                input_arguments.history_filepath,
+                name
+            ),
+            search_index_filepath=get_channel_filepath(
+                input_arguments.search_index_filepath,
+                name
+            ),
+            session_trace_filepath=get_channel_filepath(
+                input_arguments.session_trace_filepath,
+                name
+            ),
+        ))
+
+    for channel in channels:
+        channel.history_queue = asyncio.Queue(
+            input_arguments.history_queue_size
+        )
+        channel.status_updates_queue = DropOldestQueue(
+            input_arguments.status_queue_size,
+            channel.get_queue_name('status_updates_queue')
+        )
+        if not input_arguments.headless:
+            channel.messages_queue = SkippingQueue(
+                input_arguments.messages_queue_size,
+                channel.get_queue_name('messages_queue'),
+                make_skipped_messages_summary
+            )
+        for queue_name in ('history_queue', 'status_updates_queue',
+                           'messages_queue'):
+            queue = getattr(channel, queue_name)
+            if queue is not None:
+                metrics.watch_queue(channel.get_queue_name(queue_name), queue)
+    return channels
+
+
+def make_skipped_messages_summary(skipped_count):
+    return ChatMessage(
+        f'Пропущено сообщений: {skipped_count}, они есть в истории чата\n'
+    )
+
+
+def get_connection_errors(error_group):
+    # the streams of the channels may give up at the same time
+    errors = []
+    for error in error_group.exceptions:
+        if isinstance(error, ExceptionGroup):
+            nested_errors = get_connection_errors(error)
+            if nested_errors is None:
+                return None
+            errors += nested_errors
+        elif isinstance(error, ConnectionAttemptsExceeded):
+            errors.append(error)
+        else:
+            return None
+    return errors
+
+
 class WatchdogFormatter(logging.Formatter):
     def formatTime(self, record, datefmt=None):
         return int(record.created)
 
 
+def start_console_logging(input_arguments):
+    return start_logging(
+        {
+            'sender': (
+                input_arguments.log_level,
+                logging.Formatter('%(levelname)s:%(name)s:%(message)s'),
+            ),
+            'wathchdog': (
+                input_arguments.log_level,
+                WatchdogFormatter('[%(asctime)s] %(message)s'),
+            ),
+            'metrics': (
+                logging.INFO,
+                logging.Formatter('%(asctime)s:%(name)s:%(message)s'),
+            ),
+            'archiver': (
+                logging.INFO,
+                logging.Formatter('%(asctime)s:%(message)s'),
+            ),
+        },
+        rate_limited_loggers=('sender', 'wathchdog'),
+        max_records_per_second=input_arguments.max_log_records_per_second,
+        level=input_arguments.log_level,
+    )
+
+
 def main():
+    input_arguments = get_input_arguments()
+    log_listener = start_console_logging(input_arguments)
     logger = logging.getLogger('sender')
-    logger.setLevel(logging.DEBUG)
-    for handler in logger.handlers:
-        logger.removeHandler(handler)
-    console = logging.StreamHandler()
-    formatter = logging.Formatter('%(levelname)s:%(name)s:%(message)s')
-    console.setFormatter(formatter)
-    logger.addHandler(console)
-
-    watchdog_logger = logging.getLogger('wathchdog')
-    watchdog_logger.setLevel(logging.DEBUG)
-    for handler in watchdog_logger.handlers:
-        watchdog_logger.removeHandler(handler)
-    console = logging.StreamHandler()
-    formatter = WatchdogFormatter('[%(asctime)s] %(message)s')
-    console.setFormatter(formatter)
-    watchdog_logger.addHandler(console)
-    watchdog_logger.debug('Launch the new watchdog')
+    logging.getLogger('wathchdog').debug('Launch the new watchdog')
 
     try:
-        input_arguments = get_input_arguments()
         logger.info('Get input arguments')
-        messages_queue = asyncio.Queue()
-        history_queue = asyncio.Queue()
-        sending_queue = asyncio.Queue()
-        status_updates_queue = asyncio.Queue()
-        main_coroutine = draw(
-            input_arguments,
-            messages_queue,
-            history_queue,
-            sending_queue,
-            status_updates_queue,
-        )
-        logger.info('Start an event loop')
+        try:
+            channels = create_channels(input_arguments)
+        except ValueError as error:
+            logger.error(error)
+            return
         loop = asyncio.get_event_loop()
-        loop.run_until_complete(main_coroutine)
-    except (KeyboardInterrupt, TkAppClosed):
+        if input_arguments.headless:
+            # the archiver does not import tkinter to run without a display
+            from headless import archive
+
+            main_coroutine = archive(input_arguments, channels)
+            logger.info('Start an event loop')
+            loop.run_until_complete(main_coroutine)
+            return
+
+        from gui import draw, TkAppClosed
+        from process_messages import Outbox
+
+        main_channel = channels[0]
+        main_channel.sending_queue = Outbox()
+        metrics.watch_queue('sending_queue', main_channel.sending_queue)
+        main_coroutine = draw(input_arguments, channels)
+        logger.info('Start an event loop')
+        try:
+            loop.run_until_complete(main_coroutine)
+        except TkAppClosed:
+            return
+    except KeyboardInterrupt:
         return
+    except ConnectionAttemptsExceeded as error:
+        logger.error(error)
+    except ExceptionGroup as error_group:
+        errors = get_connection_errors(error_group)
+        if errors is None:
+            raise
+        for error in errors:
+            logger.error(error)
+    finally:
+        log_listener.stop()
 
 
 if __name__ == '__main__':
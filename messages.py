@@ -0,0 +1,139 @@
+import asyncio
+from collections import deque
+from datetime import datetime
+import re
+import sys
+
+# the server prefixes a message with the time and the author:
+# [18.06.21 12:34] Nickname: text
+MESSAGE_PREFIX_PATTERN = re.compile(
+    r'\[(?P<time>[^\]\n]*)\] (?P<nickname>[^:\n]*): '
+)
+MESSAGE_TIME_FORMAT = '%d.%m.%y %H:%M'
+
+
+class ChatMessage:
+    """A chat line parsed once when it is received.
+
+    The line is kept as the server sent it, the text is a slice of the line
+    from `text_offset`, so the record does not copy it. The lines without the
+    time and author prefix, like the server notices, have no timestamp and
+    nickname. `history_location` is the segment number and the offset of the
+    line in the history, it is set when the line is written.
+    """
+    __slots__ = (
+        'line',
+        'timestamp',
+        'nickname',
+        'text_offset',
+        'history_location',
+    )
+
+    def __init__(self, line, timestamp=None, nickname=None, text_offset=0):
+        self.line = line
+        self.timestamp = timestamp
+        self.nickname = nickname
+        self.text_offset = text_offset
+        self.history_location = None
+
+    @property
+    def text(self):
+        return self.line[self.text_offset:].rstrip('\n')
+
+    def __str__(self):
+        return self.line
+
+    def __repr__(self):
+        return (
+            f'ChatMessage({self.line!r}, {self.timestamp!r}, '
+            f'{self.nickname!r}, {self.text_offset!r})'
+        )
+
+
+class TimestampParser:
+    """Parse the message times remembering the last one.
+
+    The times have the minute precision, so the messages in a row usually
+    share the time and strptime is called once a minute.
+    """
+    def __init__(self):
+        self.last_time = None
+        self.last_timestamp = None
+
+    def parse(self, time_text):
+        if time_text != self.last_time:
+            try:
+                parsed_time = datetime.strptime(time_text, MESSAGE_TIME_FORMAT)
+            except ValueError:
+                return None
+            self.last_time = time_text
+            self.last_timestamp = parsed_time.timestamp()
+        return self.last_timestamp
+
+
+timestamp_parser = TimestampParser()
+
+
+def parse_message(line):
+    match = MESSAGE_PREFIX_PATTERN.match(line)
+    if not match:
+        return ChatMessage(line)
+    return ChatMessage(
+        line,
+        timestamp_parser.parse(match.group('time')),
+        # the same authors write again and again, keep a name once
+        sys.intern(match.group('nickname')),
+        match.end(),
+    )
+
+
+class SeenMessages:
+    """The last received lines to drop the ones the server sends again.
+
+    After a connection the server sends its recent messages again, they
+    repeat the end of the lines received before. `start_replay` is called
+    for every connection, the lines following it are dropped while they
+    repeat a run of the remembered lines. The first line breaking the run
+    ends the replay, so a message repeated in the live chat, like a second
+    "+1" in the same minute, is kept. Only the last `size` lines are kept.
+    The reading stream waits for `load_history_tail` before the replay.
+    """
+    def __init__(self, size):
+        self.lines = deque(maxlen=size)
+        # the indexes of the remembered lines the replay may go on with
+        self.replay_indexes = None
+        self.history_tail_loaded = asyncio.Event()
+
+    def start_replay(self):
+        self.replay_indexes = range(len(self.lines))
+
+    def remember(self, line):
+        """Remember the line, return False if it is replayed."""
+        line = line.rstrip('\n')
+        if self.replay_indexes is not None:
+            next_indexes = [
+                index + 1
+                for index in self.replay_indexes
+                if self.lines[index] == line
+            ]
+            # a run repeated up to the last line can not go on
+            self.replay_indexes = [
+                index for index in next_indexes if index < len(self.lines)
+            ] or None
+            if next_indexes:
+                return False
+        self.lines.append(line)
+        return True
+
+    async def load_history_tail(self, history):
+        try:
+            lines, _ = await history.read_lines_before(
+                history.get_end_position(),
+                self.lines.maxlen
+            )
+            for line in lines:
+                self.lines.append(line.rstrip('\n'))
+        except FileNotFoundError:
+            pass
+        finally:
+            self.history_tail_loaded.set()
@@ -0,0 +1,154 @@
+import asyncio
+from bisect import bisect_left
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger('metrics')
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.reported_value = 0
+
+    def increment(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    # bucket upper bounds grow twice from 0.1 ms to about 105 s
+    bucket_bounds = [0.0001 * 2 ** power for power in range(21)]
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(self.bucket_bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.bucket_counts[bisect_left(self.bucket_bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def get_percentile(self, percentile):
+        # the upper bound of the bucket holding the percentile
+        if not self.count:
+            return 0
+        rank = self.count * percentile / 100
+        observed_count = 0
+        for bound, bucket_count in zip(self.bucket_bounds, self.bucket_counts):
+            observed_count += bucket_count
+            if observed_count >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def get_summary(self):
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else 0,
+            'p50': self.get_percentile(50),
+            'p99': self.get_percentile(99),
+            'max': self.max,
+        }
+
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.start_time)
+
+
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.queues = {}
+        self.start_time = time.monotonic()
+        self.report_time = self.start_time
+
+    def counter(self, name):
+        if name not in self.counters:
+            self.counters[name] = Counter()
+        return self.counters[name]
+
+    def histogram(self, name):
+        if name not in self.histograms:
+            self.histograms[name] = Histogram()
+        return self.histograms[name]
+
+    def time(self, name):
+        return Timer(self.histogram(name))
+
+    def watch_queue(self, name, queue):
+        self.queues[name] = queue
+
+    def get_snapshot(self):
+        now = time.monotonic()
+        interval = max(now - self.report_time, 1e-9)
+        self.report_time = now
+        snapshot = {
+            'counters': {},
+            'rates': {},
+            'queues': {},
+            'histograms': {},
+        }
+        for name, counter in self.counters.items():
+            snapshot['counters'][name] = counter.value
+            new_events = counter.value - counter.reported_value
+            snapshot['rates'][name] = new_events / interval
+            counter.reported_value = counter.value
+        for name, queue in self.queues.items():
+            snapshot['queues'][name] = queue.qsize()
+        for name, histogram in self.histograms.items():
+            snapshot['histograms'][name] = histogram.get_summary()
+        return snapshot
+
+
+def format_snapshot(snapshot):
+    parts = []
+    for name, value in snapshot['counters'].items():
+        parts.append(f'{name}={value} ({snapshot["rates"][name]:.1f}/s)')
+    for name, size in snapshot['queues'].items():
+        parts.append(f'{name}={size}')
+    for name, summary in snapshot['histograms'].items():
+        parts.append(
+            f'{name}: p50={summary["p50"] * 1000:.1f}ms '
+            f'p99={summary["p99"] * 1000:.1f}ms '
+            f'max={summary["max"] * 1000:.1f}ms'
+        )
+    return ', '.join(parts)
+
+
+def dump_snapshot(snapshot, filepath):
+    temporary_filepath = f'{filepath}.tmp'
+    with open(temporary_filepath, 'w') as file:
+        json.dump(snapshot, file, indent=2)
+    os.replace(temporary_filepath, filepath)
+
+
+async def report_metrics(interval, dump_filepath=None):
+    if not interval:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        snapshot = metrics.get_snapshot()
+        logger.info(format_snapshot(snapshot))
+        if not dump_filepath:
+            continue
+        try:
+            dump_snapshot(snapshot, dump_filepath)
+        except OSError:
+            logger.error(f'Can not write metrics to the file {dump_filepath}')
+
+
+metrics = Metrics()
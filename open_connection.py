@@ -1,25 +1,120 @@
 import asyncio
 from contextlib import asynccontextmanager
-from itertools import count
 import logging
+import random
 import socket
 
+from async_timeout import timeout
+
+from metrics import metrics
+from statuses import ReconnectScheduled
+
 logger = logging.getLogger(__file__)
 
 
+class ConnectionAttemptsExceeded(Exception):
+    pass
+
+
+class ReconnectPolicy:
+    """Capped exponential backoff with jitter between connection attempts.
+
+    The jitter spreads the clients reconnecting after the same server outage.
+    Zero `max_attempts` means the client retries forever. The failed
+    attempts are counted across the reconnects till the stream calls
+    `reset` after the server answers, so a server accepting the connections
+    and dropping them at once is an outage too.
+    """
+    def __init__(self, connect_timeout=10, initial_delay=0.5, max_delay=30,
+                 max_attempts=0, jitter=0.5):
+        self.connect_timeout = connect_timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.jitter = jitter
+        self.failed_attempts = 0
+
+    def record_failure(self):
+        # False when no attempts are left
+        self.failed_attempts += 1
+        if not self.max_attempts:
+            return True
+        return self.failed_attempts < self.max_attempts
+
+    def reset(self):
+        self.failed_attempts = 0
+
+    def get_delay(self, attempt_number):
+        delay = min(self.initial_delay * 2 ** attempt_number, self.max_delay)
+        return delay * (1 - self.jitter * random.random())
+
+
+def enable_keepalive(writer, idle_time, timeout):
+    sock = writer.get_extra_info('socket')
+    if sock is None:
+        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if not hasattr(socket, 'TCP_KEEPIDLE'):
+        # the platform does not let to tune the probes
+        return
+    probes_count = 3
+    probe_interval = max(int(timeout / probes_count), 1)
+    keepalive_options = {
+        socket.TCP_KEEPIDLE: max(int(idle_time), 1),
+        socket.TCP_KEEPINTVL: probe_interval,
+        socket.TCP_KEEPCNT: probes_count,
+    }
+    for option, value in keepalive_options.items():
+        sock.setsockopt(socket.IPPROTO_TCP, option, value)
+
+
 @asynccontextmanager
-async def open_connection(host, port):
-    for attempt_number in count():
+async def open_connection(
+        host,
+        port,
+        reconnect_policy=None,
+        status_updates_queue=None,
+        state_class=None,
+):
+    reconnect_policy = reconnect_policy or ReconnectPolicy()
+    while True:
         try:
-            reader, writer = await asyncio.open_connection(host, port)
+            async with timeout(
+                    reconnect_policy.connect_timeout
+            ) as timeout_manager:
+                reader, writer = await asyncio.open_connection(host, port)
             break
-        except socket.gaierror:
-            logger.error(f'Can not connect to {host}')
-            if attempt_number > 2:
-                await asyncio.sleep(1)
+        except asyncio.TimeoutError:
+            if not timeout_manager.expired:
+                raise
+            error_message = 'connection timeout'
+        except OSError as error:
+            error_message = str(error)
+
+        metrics.counter('failed_connection_attempts').increment()
+        logger.error(f'Can not connect to {host}:{port}: {error_message}')
+        has_attempts_left = reconnect_policy.record_failure()
+        attempt_number = reconnect_policy.failed_attempts
+        if not has_attempts_left:
+            raise ConnectionAttemptsExceeded(
+                f'Can not connect to {host}:{port} '
+                f'after {attempt_number} attempts'
+            )
+        delay = reconnect_policy.get_delay(attempt_number - 1)
+        logger.debug(f'Reconnect to {host}:{port} in {delay:.1f}s')
+        if status_updates_queue is not None:
+            status_updates_queue.put_nowait(
+                ReconnectScheduled(state_class, attempt_number, delay)
+            )
+        await asyncio.sleep(delay)
     try:
         logger.debug(f'Establish a connection with {host}')
         yield reader, writer
     finally:
         writer.close()
-        await writer.wait_closed()
+        try:
+            # a dead server never confirms closing the connection
+            async with timeout(1):
+                await writer.wait_closed()
+        except (asyncio.TimeoutError, ConnectionError):
+            writer.transport.abort()
@@ -1,16 +1,24 @@
 import asyncio
+from collections import deque
 import json
 import logging
 import re
-from tkinter import messagebox
+import time
 
-import aiofiles
+from anyio import create_task_group, ExceptionGroup
 from async_timeout import timeout
 
-from open_connection import open_connection
-from statuses import NicknameReceived, ReadConnectionStateChanged
+from history import open_history
+from messages import parse_message, SeenMessages
+from metrics import metrics
+from open_connection import ConnectionAttemptsExceeded, enable_keepalive
+from open_connection import open_connection, ReconnectPolicy
+from statuses import ErrorOccurred, NicknameReceived
+from statuses import ReadConnectionStateChanged, ReconnectScheduled
 from statuses import SendingConnectionStateChanged
 
+HISTORY_WRITE_RETRY_DELAY = 1
+
 logger = logging.getLogger('sender')
 watchdog_logger = logging.getLogger('wathchdog')
 
@@ -19,40 +27,204 @@ class InvalidToken(Exception):
     pass
 
 
+class Outbox:
+    """The queue of outgoing messages kept until the server receives them.
+
+    A message taken by `get` stays in flight till `acknowledge` is called
+    for it, or till `skip_last` drops it if it is not sent. After a
+    reconnect the messages in flight are sent again, so a message is sent
+    at least once and may be repeated if the connection broke right before
+    the server acknowledged it.
+    """
+    def __init__(self):
+        self.pending_messages = deque()
+        self.messages_in_flight = deque()
+        self.has_pending_messages = asyncio.Event()
+
+    def put_nowait(self, message):
+        self.pending_messages.append(message)
+        self.has_pending_messages.set()
+
+    def qsize(self):
+        return len(self.pending_messages) + len(self.messages_in_flight)
+
+    async def get(self):
+        while not self.pending_messages:
+            self.has_pending_messages.clear()
+            await self.has_pending_messages.wait()
+        message = self.pending_messages.popleft()
+        self.messages_in_flight.append(message)
+        return message
+
+    def acknowledge(self):
+        self.messages_in_flight.popleft()
+
+    def skip_last(self):
+        # the last message taken is not sent, nothing will acknowledge it
+        self.messages_in_flight.pop()
+
+    def resend_messages_in_flight(self):
+        self.pending_messages.extendleft(reversed(self.messages_in_flight))
+        self.messages_in_flight.clear()
+        if self.pending_messages:
+            self.has_pending_messages.set()
+
+
 async def authorize(reader, writer, token):
     server_response = await reader.readline()
-    logger.debug(repr(server_response.decode()))
-    logger.debug(repr(token))
+    logger.debug('%r', server_response)
+    logger.debug('%r', token)
     writer.write(f'{token}\n'.encode())
     await writer.drain()
     server_response = await reader.readline()
-    decoded_response = server_response.decode()
-    logger.debug(repr(decoded_response))
+    logger.debug('%r', server_response)
     try:
         user_features = json.loads(server_response)
     except json.JSONDecodeError:
         logger.error(
-            f'Can not parse to JSON the server response: {decoded_response}.'
+            'Can not parse to JSON the server response: %r.',
+            server_response
         )
         user_features = None
     return user_features
 
 
-async def watch_for_connection(host, port, token):
-    async with open_connection(host, port) as (reader, writer):
-        await authorize(reader, writer, token)
-        while True:
-            try:
-                async with timeout(1) as timeout_manager:
-                    writer.write(b'\n')
-                    await writer.drain()
-                    await reader.readline()
-            except asyncio.TimeoutError:
-                if not timeout_manager.expired:
-                    raise
-                watchdog_logger.debug('1s timeout is elapsed')
-                raise ConnectionError
-            await asyncio.sleep(0.1)
+async def sign_up(reader, writer, user_name):
+    server_response = await reader.readline()
+    logger.debug('%r', server_response)
+    # an empty token asks the server to register a new user
+    writer.write(b'\n')
+    await writer.drain()
+    server_response = await reader.readline()
+    logger.debug('%r', server_response)
+
+    filtered_nick = re.sub(r'(\\+n|\n|\\+)', '', user_name)
+    message_to_send = f'{filtered_nick}\n'
+    logger.debug('%r', message_to_send)
+    writer.write(message_to_send.encode())
+    await writer.drain()
+
+    server_response = await reader.readline()
+    logger.debug('%r', server_response)
+    try:
+        user_features = json.loads(server_response)
+    except json.JSONDecodeError:
+        logger.error(
+            'Can not parse to JSON the server response: %r.',
+            server_response
+        )
+        user_features = None
+    return user_features
+
+
+async def read_server_response(reader, ping_timeout):
+    try:
+        async with timeout(ping_timeout) as timeout_manager:
+            server_response = await reader.readline()
+    except asyncio.TimeoutError:
+        if not timeout_manager.expired:
+            raise
+        watchdog_logger.debug('%ss timeout is elapsed', ping_timeout)
+        raise ConnectionError('The server does not respond')
+    if not server_response:
+        raise ConnectionError('The server closed the connection')
+    return server_response
+
+
+def is_connection_broken(error):
+    # a failed keepalive probe ends the read with ETIMEDOUT, an unreachable
+    # host with EHOSTUNREACH, they are not ConnectionError
+    if isinstance(error, ConnectionError):
+        return True
+    return isinstance(error, OSError) and error.errno is not None
+
+
+def filter_message(message):
+    # an empty line ends a message, the server answers every one of them
+    return '\n'.join(line for line in message.split('\n') if line)
+
+
+class SendWindow:
+    """Limit the number of the messages sent without the server answer.
+
+    `answers_expected` tells for every unanswered line whether it was a
+    message or a heartbeat, the server answers them in the same order.
+    """
+    def __init__(self, max_lines_in_flight):
+        self.slots = asyncio.Semaphore(max_lines_in_flight)
+        self.answers_expected = deque()
+        self.has_answers_expected = asyncio.Event()
+
+    def add_line(self, is_message):
+        self.answers_expected.append(is_message)
+        self.has_answers_expected.set()
+
+    def answer_line(self):
+        is_message = self.answers_expected.popleft()
+        if not self.answers_expected:
+            self.has_answers_expected.clear()
+        self.slots.release()
+        return is_message
+
+
+async def write_messages(
+        writer,
+        sending_queue,
+        send_window,
+        ping_interval,
+        max_messages_per_second,
+        session_recorder=None,
+):
+    next_message_time = 0
+    while True:
+        try:
+            async with timeout(ping_interval) as timeout_manager:
+                sending_message = await sending_queue.get()
+        except asyncio.TimeoutError:
+            if not timeout_manager.expired:
+                raise
+            sending_message = None
+
+        if sending_message is not None:
+            filtered_message = filter_message(sending_message)
+            if not filtered_message:
+                logger.debug('Skip the empty message %r', sending_message)
+                sending_queue.skip_last()
+                continue
+
+        await send_window.slots.acquire()
+        if sending_message is None:
+            watchdog_logger.debug('Send a heartbeat')
+            send_window.add_line(is_message=False)
+            writer.write(b'\n')
+            await writer.drain()
+            continue
+
+        if max_messages_per_second:
+            # follow the server flood limits
+            await asyncio.sleep(next_message_time - time.monotonic())
+            next_message_time = (
+                max(next_message_time, time.monotonic())
+                + 1 / max_messages_per_second
+            )
+        logger.debug('Пользователь написал: %s', sending_message)
+        send_window.add_line(is_message=True)
+        sending_data = f'{filtered_message}\n\n'.encode()
+        if session_recorder:
+            session_recorder.record_sent(sending_data)
+        writer.write(sending_data)
+        await writer.drain()
+        metrics.counter('messages_sent').increment()
+
+
+async def read_answers(reader, sending_queue, send_window, ping_timeout):
+    while True:
+        await send_window.has_answers_expected.wait()
+        # the server answers every message and every heartbeat
+        server_response = await read_server_response(reader, ping_timeout)
+        logger.debug('%r', server_response)
+        if send_window.answer_line():
+            sending_queue.acknowledge()
 
 
 async def send_messages(
@@ -61,9 +233,23 @@ async def send_messages(
         sending_queue,
         token,
         status_msgs_queue,
+        reconnect_policy=None,
+        ping_interval=10,
+        ping_timeout=5,
+        max_messages_in_flight=10,
+        max_messages_per_second=0,
+        session_recorder=None,
 ):
+    send_window = SendWindow(max_messages_in_flight)
+    reconnect_policy = reconnect_policy or ReconnectPolicy()
     status_msgs_queue.put_nowait(SendingConnectionStateChanged.INITIATED)
-    async with open_connection(host, port) as (reader, writer):
+    async with open_connection(
+            host,
+            port,
+            reconnect_policy,
+            status_msgs_queue,
+            SendingConnectionStateChanged,
+    ) as (reader, writer):
         status_msgs_queue.put_nowait(
             SendingConnectionStateChanged.ESTABLISHED
         )
@@ -71,30 +257,47 @@ async def send_messages(
         if not user_features:
             logger.error('Не удалось получить свойства юзера.')
             logger.error('Проверьте токен юзера.')
-            messagebox.showerror(
+            status_msgs_queue.put_nowait(ErrorOccurred(
                 'Неверный токен',
                 'Проверьте токен, сервер его не узнал'
-            )
+            ))
+            status_msgs_queue.put_nowait(SendingConnectionStateChanged.CLOSED)
             raise InvalidToken
+        reconnect_policy.reset()
         user_name = user_features["nickname"]
-        logger.debug(f'Выполнена авторизация. Пользователь {user_name}')
+        logger.debug('Выполнена авторизация. Пользователь %s', user_name)
         status_msgs_queue.put_nowait(NicknameReceived(user_name))
 
+        # the greeting after the authorization
+        await read_server_response(reader, ping_timeout)
         try:
-            while True:
-                sending_message = await sending_queue.get()
-                logger.debug(f'Пользователь написал: {sending_message}')
-                filtered_message = re.sub(r'\n\n', '', sending_message)
-                server_response = await reader.readline()
-                logger.debug(repr(server_response.decode()))
-                writer.write((filtered_message + '\n').encode())
-                await writer.drain()
-                writer.write(b'\n')
-                await writer.drain()
+            async with create_task_group() as task_group:
+                await task_group.spawn(
+                    write_messages,
+                    writer,
+                    sending_queue,
+                    send_window,
+                    ping_interval,
+                    max_messages_per_second,
+                    session_recorder,
+                )
+                await task_group.spawn(
+                    read_answers,
+                    reader,
+                    sending_queue,
+                    send_window,
+                    ping_timeout,
+                )
+        except ExceptionGroup as error_group:
+            # both coroutines may find out the connection is broken
+            for error in error_group.exceptions:
+                if not is_connection_broken(error):
+                    raise
+            raise ConnectionError('The sending connection is broken')
         finally:
             logger.debug('Stop the coroutine "send_messages"')
+            sending_queue.resend_messages_in_flight()
             status_msgs_queue.put_nowait(SendingConnectionStateChanged.CLOSED)
-            raise
 
 
 async def read_msgs(
@@ -103,31 +306,260 @@ async def read_msgs(
         host,
         port,
         status_updates_queue,
+        reconnect_policy=None,
+        ping_interval=10,
+        ping_timeout=5,
+        seen_messages=None,
+        session_recorder=None,
 ):
+    reconnect_policy = reconnect_policy or ReconnectPolicy()
     status_updates_queue.put_nowait(ReadConnectionStateChanged.INITIATED)
-    async with open_connection(host, port) as (reader, writer):
+    async with open_connection(
+            host,
+            port,
+            reconnect_policy,
+            status_updates_queue,
+            ReadConnectionStateChanged,
+    ) as (reader, writer):
         status_updates_queue.put_nowait(ReadConnectionStateChanged.ESTABLISHED)
+        # the reading port does not answer, let TCP check the quiet chat
+        enable_keepalive(writer, ping_interval, ping_timeout)
+        if seen_messages:
+            # the client may still be reading the history tail
+            await seen_messages.history_tail_loaded.wait()
+            seen_messages.start_replay()
         try:
             while True:
                 received_data = await reader.readline()
-                message = received_data.decode()
-                message_queue.put_nowait(message)
-                history_queue.put_nowait(message)
+                if not received_data:
+                    raise ConnectionError('The server closed the connection')
+                reconnect_policy.reset()
+                if session_recorder:
+                    session_recorder.record_received(received_data)
+                message = parse_message(received_data.decode())
+                metrics.counter('messages_received').increment()
+                if seen_messages and not seen_messages.remember(message.line):
+                    # the server replays its backlog after a reconnect
+                    metrics.counter('duplicate_messages_dropped').increment()
+                    continue
+                if message_queue is not None:
+                    message_queue.put_nowait(message)
+                # the history never drops messages, wait for the disk
+                if history_queue.full():
+                    metrics.counter('history_queue_overflow').increment()
+                await history_queue.put(message)
         finally:
             logger.debug('Stop the coroutine "read_msgs"')
             status_updates_queue.put_nowait(ReadConnectionStateChanged.CLOSED)
             raise
 
 
-async def save_messages(filepath, history_queue):
+async def save_messages(
+        history_writer,
+        history_queue,
+        status_updates_queue,
+        search_index=None,
+):
+    filepath = history_writer.filepath
+    is_writing_failed = False
+    # the messages in the writer buffer, they learn their history location
+    # when they are written
+    buffered_messages = []
+    async with history_writer:
+        while True:
+            new_messages = []
+            try:
+                async with timeout(
+                        history_writer.get_flush_timeout()
+                ) as timeout_manager:
+                    new_messages.append(await history_queue.get())
+            except asyncio.TimeoutError:
+                if not timeout_manager.expired:
+                    raise
+            while not history_queue.empty():
+                new_messages.append(history_queue.get_nowait())
+            for message in new_messages:
+                history_writer.add(message.line)
+            buffered_messages += new_messages
+            if not history_writer.is_flush_due():
+                continue
+
+            try:
+                with metrics.time('history_write_seconds'):
+                    written_lines = await history_writer.flush()
+            except OSError:
+                logger.error(f'Can not write messages to the file {filepath}')
+                if not is_writing_failed:
+                    status_updates_queue.put_nowait(ErrorOccurred(
+                        'Ошибка записи истории',
+                        f'Не удается записать историю сообщений в файл '
+                        f'{filepath}',
+                        is_warning=True
+                    ))
+                is_writing_failed = True
+                # the lines stay in the buffer, try again a bit later
+                await asyncio.sleep(HISTORY_WRITE_RETRY_DELAY)
+            else:
+                for message, (segment_number, offset, _) in zip(
+                        buffered_messages,
+                        written_lines
+                ):
+                    message.history_location = segment_number, offset
+                buffered_messages.clear()
+                metrics.counter('messages_persisted').increment(
+                    len(written_lines)
+                )
+                is_writing_failed = False
+                if search_index:
+                    await search_index.add_lines(written_lines)
+
+
+async def supervise_connection(
+        reconnect_policy,
+        status_updates_queue,
+        state_class,
+        coroutine,
+        *args,
+):
+    # restart the stream without touching the other ones
     while True:
-        new_message = await history_queue.get()
         try:
-            async with aiofiles.open(filepath, 'a') as chat_history_file:
-                await chat_history_file.write(new_message)
-        except FileNotFoundError:
-            logger.error(f'Can not write messages to the file {filepath}')
-            messagebox.showwarning(
-                'Ошибка записи истории',
-                f'Не удается записать историю сообщений в файл {filepath}'
+            await coroutine(*args)
+        except OSError as error:
+            if not is_connection_broken(error):
+                raise
+            logger.debug('Restart "%s": %s', coroutine.__name__, error)
+            metrics.counter('reconnects').increment()
+            # a connection broken before the server answered is a failed
+            # attempt too
+            if not reconnect_policy.record_failure():
+                raise ConnectionAttemptsExceeded(
+                    f'"{coroutine.__name__}" lost the connection '
+                    f'{reconnect_policy.failed_attempts} times in a row'
+                )
+            # do not let all the clients reconnect at the same moment
+            attempt_number = reconnect_policy.failed_attempts
+            delay = reconnect_policy.get_delay(attempt_number - 1)
+            if status_updates_queue is not None:
+                status_updates_queue.put_nowait(
+                    ReconnectScheduled(state_class, attempt_number, delay)
+                )
+            await asyncio.sleep(delay)
+        except InvalidToken:
+            # the user sees the error, the other streams keep working
+            logger.error(
+                'Stop "%s": the token is rejected',
+                coroutine.__name__
+            )
+            return
+
+
+def create_reconnect_policy(input_arguments):
+    return ReconnectPolicy(
+        input_arguments.connect_timeout,
+        max_delay=input_arguments.reconnect_max_delay,
+        max_attempts=input_arguments.reconnect_max_attempts,
+    )
+
+
+async def handle_connection(input_arguments, channel, seen_messages=None,
+                            session_recorder=None):
+    # the streams count their failed attempts separately
+    reading_policy = create_reconnect_policy(input_arguments)
+    sending_policy = create_reconnect_policy(input_arguments)
+    async with create_task_group() as task_group:
+        await task_group.spawn(
+            supervise_connection,
+            reading_policy,
+            channel.status_updates_queue,
+            ReadConnectionStateChanged,
+            read_msgs,
+            channel.messages_queue,
+            channel.history_queue,
+            channel.host,
+            channel.reading_port,
+            channel.status_updates_queue,
+            reading_policy,
+            input_arguments.ping_interval,
+            input_arguments.ping_timeout,
+            seen_messages,
+            session_recorder,
+        )
+        if channel.sending_queue is not None:
+            await task_group.spawn(
+                supervise_connection,
+                sending_policy,
+                channel.status_updates_queue,
+                SendingConnectionStateChanged,
+                send_messages,
+                channel.host,
+                channel.sending_port,
+                channel.sending_queue,
+                channel.token,
+                channel.status_updates_queue,
+                sending_policy,
+                input_arguments.ping_interval,
+                input_arguments.ping_timeout,
+                input_arguments.max_messages_in_flight,
+                input_arguments.max_messages_per_second,
+                session_recorder,
             )
+
+
+async def connect_channel(input_arguments, channel, task_group):
+    """Start the channel streams, return its history and dedup window.
+
+    The reading stream waits till the caller loads the history tail to the
+    dedup window.
+    """
+    history = open_history(
+        channel.history_filepath,
+        input_arguments.history_format,
+        input_arguments.history_segment_size,
+        input_arguments.history_max_segments,
+    )
+    seen_messages = None
+    if input_arguments.dedup_window_size:
+        seen_messages = SeenMessages(input_arguments.dedup_window_size)
+    session_recorder = None
+    if channel.session_trace_filepath:
+        # the trace and the search modules are imported only when used
+        from session_trace import SessionRecorder
+
+        session_recorder = SessionRecorder(channel.session_trace_filepath)
+        await task_group.spawn(session_recorder.run)
+    await task_group.spawn(
+        handle_connection,
+        input_arguments,
+        channel,
+        seen_messages,
+        session_recorder,
+    )
+    return history, seen_messages
+
+
+async def save_channel_history(input_arguments, channel, history,
+                               task_group):
+    """Save the channel messages, return the search index if it is used."""
+    search_index = None
+    if channel.search_index_filepath:
+        from search_index import index_history, SearchIndex
+
+        search_index = SearchIndex(channel.search_index_filepath)
+        if await search_index.open(channel.status_updates_queue):
+            await task_group.spawn(index_history, search_index, history)
+        else:
+            # the chat goes on without the search
+            search_index = None
+    await task_group.spawn(
+        save_messages,
+        history.create_writer(
+            input_arguments.history_flush_size,
+            input_arguments.history_flush_interval,
+            input_arguments.history_fsync,
+        ),
+        channel.history_queue,
+        channel.status_updates_queue,
+        search_index,
+    )
+    return search_index
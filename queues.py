@@ -0,0 +1,52 @@
+import asyncio
+
+from metrics import metrics
+
+
+class SkippingQueue(asyncio.Queue):
+    """A bounded queue which skips the new items when it is full.
+
+    When the consumer catches up, the queue yields the item made by
+    `make_summary(skipped_count)` in place of the skipped items.
+    """
+    def __init__(self, maxsize, name, make_summary=None):
+        # the extra slot is kept for the summary
+        super().__init__(maxsize + 1 if maxsize else 0)
+        self.limit = maxsize
+        self.name = name
+        self.make_summary = make_summary
+        self.skipped_count = 0
+
+    def put_nowait(self, item):
+        if self.limit and self.qsize() >= self.limit:
+            self.skipped_count += 1
+            metrics.counter(f'{self.name}_overflow').increment()
+            return
+        self.put_summary()
+        super().put_nowait(item)
+
+    def get_nowait(self):
+        item = super().get_nowait()
+        if self.empty():
+            self.put_summary()
+        return item
+
+    def put_summary(self):
+        if not self.skipped_count:
+            return
+        skipped_count, self.skipped_count = self.skipped_count, 0
+        if self.make_summary:
+            super().put_nowait(self.make_summary(skipped_count))
+
+
+class DropOldestQueue(asyncio.Queue):
+    """A bounded queue which drops the oldest item to put a new one."""
+    def __init__(self, maxsize, name):
+        super().__init__(maxsize)
+        self.name = name
+
+    def put_nowait(self, item):
+        if self.full():
+            super().get_nowait()
+            metrics.counter(f'{self.name}_overflow').increment()
+        super().put_nowait(item)
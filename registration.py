@@ -1,28 +1,32 @@
 import asyncio
-import json
 import logging
-import re
-import socket
 import tkinter as tk
-from tkinter import messagebox
 from tkinter.scrolledtext import ScrolledText
 
 from anyio import create_task_group
 from async_timeout import timeout
 
-from gui import TkAppClosed
+from gui import NotificationBanner, show_notifications, TkAppClosed
 from gui import update_conversation_history as update_scroll_panel, update_tk
+from open_connection import ConnectionAttemptsExceeded, open_connection
+from open_connection import ReconnectPolicy
+from process_messages import sign_up
+from queues import DropOldestQueue
+from statuses import ErrorOccurred
 
 logger = logging.getLogger(__file__)
 DEFAULT_HOST_ADDRESS = 'minechat.dvmn.org'
 DEFAULT_REGISTRATION_PORT = 5050
+LOG_QUEUE_SIZE = 1000
+REQUEST_TIMEOUT = 10
 
 
 def process_button_click(
         host_entry,
         port_entry,
         username_entry,
-        request_info_queue
+        request_info_queue,
+        notifications_queue,
 ):
     host = host_entry.get()
     port = port_entry.get()
@@ -32,10 +36,26 @@ def process_button_click(
         username_entry.delete(0, tk.END)
     else:
         warning_msg = 'Для регистрации должны быть заполнены все поля'
-        messagebox.showwarning('Не все поля заполнены', warning_msg)
+        notifications_queue.put_nowait(ErrorOccurred(
+            'Не все поля заполнены',
+            warning_msg,
+            is_warning=True
+        ))
 
 
-async def register(request_info_queue, new_user_hash_queue, message_queue):
+def report_error(message_queue, notifications_queue, error_message, hint):
+    logger.error(error_message)
+    message_queue.put_nowait(error_message)
+    notifications_queue.put_nowait(ErrorOccurred(error_message, hint))
+
+
+async def register(
+        request_info_queue,
+        new_user_hash_queue,
+        message_queue,
+        notifications_queue,
+):
+    reconnect_policy = ReconnectPolicy(REQUEST_TIMEOUT, max_attempts=1)
     while True:
         host, port, user_name = await request_info_queue.get()
         server_address = f'{host}:{port}'
@@ -43,44 +63,36 @@ async def register(request_info_queue, new_user_hash_queue, message_queue):
         logger.debug(msg)
         message_queue.put_nowait(msg)
         try:
-            async with timeout(10) as timeout_manager:
-                reader, writer = await asyncio.open_connection(host, port)
-        except socket.gaierror:
-            error_message = f'Нет соединения с сервером "{server_address}"'
-            logger.error(error_message)
-            message_queue.put_nowait(error_message)
-            messagebox.showerror(error_message, 'Проверьте адрес и соединение')
+            async with open_connection(
+                    host,
+                    port,
+                    reconnect_policy
+            ) as (reader, writer):
+                async with timeout(REQUEST_TIMEOUT) as timeout_manager:
+                    user_features = await sign_up(reader, writer, user_name)
+        except (ConnectionAttemptsExceeded, ConnectionError):
+            report_error(
+                message_queue,
+                notifications_queue,
+                f'Нет соединения с сервером "{server_address}"',
+                'Проверьте адрес и соединение'
+            )
             continue
         except asyncio.TimeoutError:
             if not timeout_manager.expired:
                 raise
-            error_message = f'Нет ответа от {server_address}'
-            logger.error(error_message)
-            message_queue.put_nowait(error_message)
-            messagebox.showerror(error_message, 'Проверьте адрес и порт')
+            report_error(
+                message_queue,
+                notifications_queue,
+                f'Нет ответа от {server_address}',
+                'Проверьте адрес и порт'
+            )
             continue
 
-        server_response = await reader.readline()
-        logger.debug(repr(server_response.decode()))
-
-        writer.write(b'\n')
-        await writer.drain()
-        server_response = await reader.readline()
-        logger.debug(repr(server_response.decode()))
-
-        filtered_nick = re.sub(r'(\\+n|\n|\\+)', '', user_name)
-        message_to_send = f'{filtered_nick}\n'
-        logger.debug(repr(message_to_send))
-        writer.write(message_to_send.encode())
-        await writer.drain()
-
-        server_response = await reader.readline()
-        logger.debug(repr(server_response.decode()))
-        user_features = json.loads(server_response)
         try:
             user_token = user_features['account_hash']
             message_queue.put_nowait(f'Получен токен: {user_token}')
-        except (AttributeError, KeyError):
+        except (TypeError, KeyError):
             user_token = None
             warning_message = f'Не удалось зарегистрировать пользователя'
             logger.warning(warning_message)
@@ -104,6 +116,8 @@ async def draw(request_info_queue, new_user_hash_queue, msg_queue):
     root = tk.Tk()
     root.title('Регистрация в чат Майнкрафтера')
     root_frame = tk.Frame(root)
+    notification_banner = NotificationBanner(root_frame)
+    notifications_queue = asyncio.Queue()
     upper_frame = tk.Frame(root_frame)
     lower_frame = tk.Frame(root_frame)
 
@@ -124,7 +138,8 @@ async def draw(request_info_queue, new_user_hash_queue, msg_queue):
         host_entry,
         port_entry,
         user_name_entry,
-        request_info_queue
+        request_info_queue,
+        notifications_queue,
     )
 
     log_panel_label = tk.Label(lower_frame, text='Журнал сообщений')
@@ -151,7 +166,8 @@ async def draw(request_info_queue, new_user_hash_queue, msg_queue):
             register,
             request_info_queue,
             new_user_hash_queue,
-            msg_queue
+            msg_queue,
+            notifications_queue,
         )
         await task_group.spawn(
             update_hash_label,
@@ -159,6 +175,11 @@ async def draw(request_info_queue, new_user_hash_queue, msg_queue):
             new_user_hash_queue
         )
         await task_group.spawn(update_scroll_panel, log_panel, msg_queue)
+        await task_group.spawn(
+            show_notifications,
+            notification_banner,
+            notifications_queue
+        )
 
 
 def main():
@@ -170,7 +191,7 @@ def main():
 
     request_info_queue = asyncio.Queue()
     new_user_hash_queue = asyncio.Queue()
-    msg_queue = asyncio.Queue()
+    msg_queue = DropOldestQueue(LOG_QUEUE_SIZE, 'registration_log_queue')
     try:
         main_coroutine = draw(
             request_info_queue,
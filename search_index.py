@@ -0,0 +1,231 @@
+"""The full-text search index of the chat history.
+
+The index is an SQLite FTS5 table kept on the disk next to the history, so
+a query does not scan the history and the memory use does not depend on
+the history size. save_messages adds the saved lines to the index and the
+index catches up with the lines saved while it was not running. To build
+the index for an existing history run:
+
+    $ python search_index.py --history_filepath chat_history.txt
+"""
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import sqlite3
+import sys
+
+from history import open_history
+from statuses import ErrorOccurred
+
+logger = logging.getLogger('search_index')
+CATCH_UP_BATCH_SIZE = 1000
+
+
+def make_match_query(query):
+    # quote the words to search them as they are, not as FTS5 operators
+    words = query.split()
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in words)
+
+
+class SearchIndex:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        # SQLite objects must be used from the thread which created them
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.connection = None
+        self.indexed_position = (0, 0)
+        self.is_catching_up = False
+        self.pending_lines = []
+
+    async def run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    def open_database(self):
+        self.connection = sqlite3.connect(self.filepath)
+        self.connection.executescript('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages
+                USING fts5(text, segment UNINDEXED, offset UNINDEXED);
+            CREATE TABLE IF NOT EXISTS progress (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                segment INTEGER,
+                offset INTEGER
+            );
+        ''')
+        row = self.connection.execute(
+            'SELECT segment, offset FROM progress'
+        ).fetchone()
+        if row:
+            self.indexed_position = tuple(row)
+
+    def close_database(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def insert_lines(self, written_lines):
+        new_rows = []
+        for segment_number, offset, line in written_lines:
+            if (segment_number, offset) < self.indexed_position:
+                continue
+            new_rows.append((line.strip(), segment_number, offset))
+            line_end = offset + len(line.encode('utf-8', errors='replace'))
+            self.indexed_position = (segment_number, line_end)
+        if not new_rows:
+            return
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO messages (text, segment, offset) '
+                'VALUES (?, ?, ?)',
+                new_rows
+            )
+            self.connection.execute(
+                'INSERT OR REPLACE INTO progress VALUES (0, ?, ?)',
+                self.indexed_position
+            )
+
+    def select_lines(self, query, limit):
+        match_query = make_match_query(query)
+        if not match_query:
+            return []
+        return self.connection.execute(
+            'SELECT segment, offset, text FROM messages '
+            'WHERE messages MATCH ? ORDER BY rowid DESC LIMIT ?',
+            (match_query, limit)
+        ).fetchall()
+
+    def delete_segments_before(self, segment_number):
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM messages WHERE segment < ?',
+                (segment_number,)
+            )
+
+    async def open(self, status_updates_queue=None):
+        """Return False if the index can not be opened."""
+        try:
+            await self.run(self.open_database)
+        except sqlite3.Error as error:
+            logger.error(
+                f'Can not open the search index {self.filepath}: {error}'
+            )
+            if status_updates_queue is not None:
+                status_updates_queue.put_nowait(ErrorOccurred(
+                    'Ошибка поиска',
+                    f'Не удается открыть индекс поиска {self.filepath}, '
+                    f'поиск по истории отключен',
+                    is_warning=True
+                ))
+            await self.close()
+            return False
+        return True
+
+    async def close(self):
+        await self.run(self.close_database)
+        self.executor.shutdown(wait=False)
+
+    async def add_lines(self, written_lines):
+        if self.is_catching_up:
+            # catch_up indexes them after the lines saved before
+            self.pending_lines.extend(written_lines)
+            return
+        try:
+            await self.run(self.insert_lines, written_lines)
+        except sqlite3.Error as error:
+            logger.error(f'Can not add messages to the search index: {error}')
+
+    async def search(self, query, limit=100):
+        """Return the newest lines matching all the words of the query.
+
+        Every line comes with its segment number and offset in the history.
+        Return None if the index can not be read.
+        """
+        try:
+            return await self.run(self.select_lines, query, limit)
+        except sqlite3.Error as error:
+            logger.error(f'Can not search the chat history: {error}')
+            return None
+
+    async def catch_up(self, history):
+        self.is_catching_up = True
+        try:
+            segments = history.get_segments()
+            if segments:
+                await self.run(self.delete_segments_before, segments[0][0])
+            batch = []
+            try:
+                async for written_line in history.iter_lines(
+                        *self.indexed_position
+                ):
+                    batch.append(written_line)
+                    if len(batch) >= CATCH_UP_BATCH_SIZE:
+                        await self.run(self.insert_lines, batch)
+                        batch = []
+            except FileNotFoundError:
+                pass
+            await self.run(self.insert_lines, batch)
+        finally:
+            self.is_catching_up = False
+        pending_lines, self.pending_lines = self.pending_lines, []
+        await self.run(self.insert_lines, pending_lines)
+
+
+async def index_history(search_index, history):
+    try:
+        await search_index.catch_up(history)
+    except sqlite3.Error as error:
+        logger.error(f'Can not index the chat history: {error}')
+        return
+    logger.info('The chat history is indexed')
+
+
+async def build_index(input_arguments):
+    history = open_history(
+        input_arguments.history_filepath,
+        input_arguments.history_format,
+    )
+    search_index = SearchIndex(input_arguments.search_index_filepath)
+    if not await search_index.open():
+        return False
+    try:
+        await search_index.catch_up(history)
+        if not input_arguments.query:
+            return True
+        found_lines = await search_index.search(input_arguments.query)
+        if found_lines is None:
+            return False
+        for segment_number, offset, text in found_lines:
+            location = history.format_location(segment_number, offset)
+            print(f'{location}: {text}')
+        return True
+    finally:
+        await search_index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--history_filepath', default='chat_history.txt')
+    parser.add_argument(
+        '--history_format',
+        choices=['plain', 'segmented', 'compressed'],
+        default='plain'
+    )
+    parser.add_argument(
+        '--search_index_filepath',
+        help='Defaults to the history file path with ".search" suffix.'
+    )
+    parser.add_argument('--query', help='Print the lines matching the query.')
+    input_arguments = parser.parse_args()
+    if not input_arguments.search_index_filepath:
+        input_arguments.search_index_filepath = (
+            f'{input_arguments.history_filepath}.search'
+        )
+    if not asyncio.run(build_index(input_arguments)):
+        sys.exit(
+            f'Can not search the index {input_arguments.search_index_filepath}'
+        )
+
+
+if __name__ == '__main__':
+    main()
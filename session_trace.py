@@ -0,0 +1,120 @@
+"""Record the raw chat traffic to replay it later.
+
+A trace is a file of gzip members like the compressed history. A record
+is a header with the time the bytes were seen, the record kind and the
+data size, followed by the data:
+
+    time: double, kind: byte, size: unsigned int, data: size bytes
+
+The received records are the lines read_msgs got from the reading port,
+the sent records are the messages send_messages wrote to the sending port.
+"""
+import asyncio
+import logging
+import struct
+import time
+import zlib
+
+import aiofiles
+from anyio import open_cancel_scope
+
+from history import decompress_blocks
+
+RECORD_HEADER = struct.Struct('>dBI')
+RECEIVED = 0
+SENT = 1
+
+logger = logging.getLogger('session_trace')
+
+
+class TraceRecord:
+    __slots__ = ('timestamp', 'kind', 'data')
+
+    def __init__(self, timestamp, kind, data):
+        self.timestamp = timestamp
+        self.kind = kind
+        self.data = data
+
+
+class SessionRecorder:
+    """Buffer the records and append them to the trace file periodically.
+
+    The records are only added to the buffer, so recording costs a struct
+    pack per line. `run` writes the buffer as a compressed block every
+    `flush_interval` seconds and when it is cancelled. A failed write keeps
+    the records in the buffer till the next one, it never stops the chat.
+    """
+    def __init__(self, filepath, flush_interval=1, compresslevel=6):
+        self.filepath = filepath
+        self.flush_interval = flush_interval
+        self.compresslevel = compresslevel
+        self.buffer = bytearray()
+        self.is_writing_failed = False
+
+    def record(self, kind, data):
+        self.buffer += RECORD_HEADER.pack(time.time(), kind, len(data))
+        self.buffer += data
+
+    def record_received(self, data):
+        self.record(RECEIVED, data)
+
+    def record_sent(self, data):
+        self.record(SENT, data)
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        compressor = zlib.compressobj(
+            self.compresslevel,
+            zlib.DEFLATED,
+            zlib.MAX_WBITS | 16
+        )
+        block = compressor.compress(data) + compressor.flush()
+        try:
+            async with aiofiles.open(self.filepath, 'ab') as trace_file:
+                await trace_file.write(block)
+        except OSError as error:
+            if not self.is_writing_failed:
+                logger.error(
+                    f'Can not write the session trace {self.filepath}: '
+                    f'{error}'
+                )
+            self.is_writing_failed = True
+            # the records stay in the buffer, try again on the next flush
+            self.buffer[:0] = data
+            return
+        self.is_writing_failed = False
+
+    async def run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        finally:
+            async with open_cancel_scope(shield=True):
+                await self.flush()
+
+
+def parse_records(data):
+    records = []
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        timestamp, kind, size = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        if offset + size > len(data):
+            break
+        records.append(TraceRecord(
+            timestamp,
+            kind,
+            data[offset:offset + size]
+        ))
+        offset += size
+    return records
+
+
+async def read_trace(filepath):
+    async with aiofiles.open(filepath, 'rb') as trace_file:
+        data = await trace_file.read()
+    return parse_records(decompress_blocks(data))
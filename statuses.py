@@ -6,6 +6,27 @@ class NicknameReceived:
         self.nickname = nickname
 
 
+class ErrorOccurred:
+    def __init__(self, title, message, is_warning=False):
+        self.title = title
+        self.message = message
+        self.is_warning = is_warning
+
+
+class ReconnectScheduled:
+    def __init__(self, state_class, attempt_number, delay):
+        # the state class tells which connection is going to reconnect
+        self.state_class = state_class
+        self.attempt_number = attempt_number
+        self.delay = delay
+
+    def __str__(self):
+        return (
+            f'переподключение через {self.delay:.0f} с '
+            f'(попытка {self.attempt_number})'
+        )
+
+
 class ReadConnectionStateChanged(Enum):
     INITIATED = 'устанавливаем соединение'
     ESTABLISHED = 'соединение установлено'
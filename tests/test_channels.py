@@ -0,0 +1,84 @@
+from argparse import Namespace
+
+import pytest
+
+from channels import Channel, get_channel_filepath, parse_channel_spec
+from main import create_channels
+
+
+def make_input_arguments(channels):
+    return Namespace(
+        host='chat.org',
+        reading_port=5000,
+        sending_port=5050,
+        token='token',
+        history_filepath='chat.txt',
+        search_index_filepath='',
+        session_trace_filepath='session.trace',
+        channels=channels,
+        headless=False,
+        history_queue_size=10,
+        status_queue_size=10,
+        messages_queue_size=10,
+    )
+
+
+def test_parse_channel_spec():
+    assert parse_channel_spec('other=chat2.org:5000') == (
+        'other',
+        'chat2.org',
+        5000,
+    )
+    # the last colon separates the port of an IPv6 host
+    assert parse_channel_spec('local=::1:5000') == ('local', '::1', 5000)
+
+
+@pytest.mark.parametrize('channel_spec', [
+    'chat2.org:5000',
+    '=chat2.org:5000',
+    'other=:5000',
+    'other=chat2.org',
+    'other=chat2.org:port',
+])
+def test_parse_channel_spec_rejects_bad_specs(channel_spec):
+    with pytest.raises(ValueError):
+        parse_channel_spec(channel_spec)
+
+
+def test_channel_files_are_next_to_main_ones():
+    assert get_channel_filepath('chat.txt', 'other') == 'chat.other.txt'
+    assert get_channel_filepath('logs/chat', 'other') == 'logs/chat.other'
+    assert get_channel_filepath('', 'other') == ''
+
+
+def test_queue_names_of_main_channel_are_kept():
+    assert Channel('main', 'chat.org', 5000).get_queue_name(
+        'messages_queue'
+    ) == 'messages_queue'
+    assert Channel('other', 'chat.org', 5000).get_queue_name(
+        'messages_queue'
+    ) == 'other.messages_queue'
+
+
+def test_create_channels():
+    channels = create_channels(
+        make_input_arguments(['other=chat2.org:6000'])
+    )
+    main_channel, other_channel = channels
+
+    assert main_channel.sending_port == 5050
+    assert other_channel.sending_port is None
+    assert other_channel.host == 'chat2.org'
+    assert other_channel.reading_port == 6000
+    assert other_channel.history_filepath == 'chat.other.txt'
+    assert other_channel.search_index_filepath == ''
+    assert other_channel.session_trace_filepath == 'session.other.trace'
+    assert all(channel.messages_queue is not None for channel in channels)
+
+
+def test_create_channels_rejects_repeated_names():
+    with pytest.raises(ValueError):
+        create_channels(make_input_arguments([
+            'other=chat2.org:6000',
+            'other=chat3.org:6000',
+        ]))
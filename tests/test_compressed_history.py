@@ -0,0 +1,92 @@
+import asyncio
+import gzip
+import os
+
+from compress_history import compress_history
+from history import CompressedHistory, decompress_blocks
+
+
+def make_lines(block_number):
+    return [f'block {block_number} line {number}\n' for number in range(3)]
+
+
+async def write_blocks(history, block_count):
+    async with history.create_writer(64 * 1024, 1, False) as writer:
+        for block_number in range(block_count):
+            for line in make_lines(block_number):
+                writer.add(line)
+            await writer.flush()
+
+
+def read_all_lines(history):
+    lines, _ = asyncio.run(history.read_lines_after(
+        history.get_start_position(),
+        100
+    ))
+    return lines
+
+
+def test_block_not_indexed_yet_is_not_read(tmp_path):
+    history = CompressedHistory(str(tmp_path / 'chat.txt.gz'))
+    asyncio.run(write_blocks(history, 3))
+    # the writer appended the last block and has not indexed it yet
+    with open(history.index_path, 'rb') as index_file:
+        index_entries = index_file.readlines()
+    with open(history.index_path, 'wb') as index_file:
+        index_file.writelines(index_entries[:2])
+
+    assert read_all_lines(history) == make_lines(0) + make_lines(1)
+
+
+def test_history_without_index_is_read_as_one_block(tmp_path):
+    history = CompressedHistory(str(tmp_path / 'chat.txt.gz'))
+    asyncio.run(write_blocks(history, 2))
+    os.remove(history.index_path)
+
+    assert read_all_lines(history) == make_lines(0) + make_lines(1)
+    assert asyncio.run(history.read_lines_before(
+        history.get_end_position(),
+        1
+    ))[0] == make_lines(1)[-1:]
+
+
+def test_blocks_are_readable_by_gzip(tmp_path):
+    history = CompressedHistory(str(tmp_path / 'chat.txt.gz'))
+    asyncio.run(write_blocks(history, 2))
+    with gzip.open(history.filepath, 'rt', encoding='utf-8') as history_file:
+        assert history_file.readlines() == make_lines(0) + make_lines(1)
+
+
+def test_block_cut_by_crash_is_skipped():
+    blocks = [gzip.compress(b'first\n'), gzip.compress(b'second\n')]
+    data = blocks[0] + blocks[1][:-4]
+    assert decompress_blocks(data) == b'first\n'
+    assert decompress_blocks(b''.join(blocks), max_count=1) == b'first\n'
+
+
+def test_converter_keeps_last_line_without_line_break(tmp_path):
+    source_filepath = tmp_path / 'chat.txt'
+    source_filepath.write_bytes(b'a\nb\nlast')
+    target_filepath = str(tmp_path / 'chat.txt.gz')
+    asyncio.run(compress_history(str(source_filepath), target_filepath, 2))
+
+    with gzip.open(target_filepath, 'rb') as target_file:
+        assert target_file.read() == b'a\nb\nlast\n'
+
+
+def test_block_offsets_are_read_from_the_last_index_size(tmp_path):
+    history = CompressedHistory(str(tmp_path / 'chat.txt.gz'))
+    asyncio.run(write_blocks(history, 2))
+    assert len(asyncio.run(history.read_block_offsets())) == 2
+
+    asyncio.run(write_blocks(history, 1))
+    # an entry cut in the middle is read when the writer finishes it
+    with open(history.index_path, 'ab') as index_file:
+        index_file.write(b'1.000')
+    block_offsets = asyncio.run(history.read_block_offsets())
+    assert len(block_offsets) == 3
+    assert block_offsets == sorted(set(block_offsets))
+    assert history.index_size_read == os.path.getsize(history.index_path) - 5
+    assert read_all_lines(history) == (
+        make_lines(0) + make_lines(1) + make_lines(0)
+    )
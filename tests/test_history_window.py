@@ -0,0 +1,183 @@
+import asyncio
+
+from gui import HistoryWindow
+from history import PlainHistory
+from messages import parse_message
+from process_messages import save_messages
+
+
+def make_line(number):
+    return f'[18.06.21 12:34] Bob: message {number}\n'
+
+
+def write_lines(filepath, lines):
+    with open(filepath, 'a', encoding='utf-8') as history_file:
+        history_file.writelines(lines)
+
+
+def make_written_message(history, line):
+    message = parse_message(line)
+    message.history_location = 0, history.get_end_position()
+    write_lines(history.filepath, [line])
+    return message
+
+
+async def load_window(history, line_count):
+    history_window = HistoryWindow(history)
+    lines, start_position = await history.read_lines_before(
+        history.get_end_position(),
+        line_count
+    )
+    history_window.prepend_lines(lines, start_position)
+    return history_window
+
+
+def test_save_messages_sets_history_locations(tmp_path):
+    history = PlainHistory(str(tmp_path / 'chat.txt'))
+    write_lines(history.filepath, [make_line(0)])
+    messages = [parse_message(make_line(number)) for number in (1, 2)]
+
+    async def run():
+        history_queue = asyncio.Queue()
+        for message in messages:
+            history_queue.put_nowait(message)
+        task = asyncio.ensure_future(save_messages(
+            history.create_writer(64 * 1024, 0.01, False),
+            history_queue,
+            asyncio.Queue(),
+        ))
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(run())
+    first_offset = len(make_line(0))
+    assert messages[0].history_location == (0, first_offset)
+    assert messages[1].history_location == (
+        0,
+        first_offset + len(make_line(1))
+    )
+
+
+def test_trim_top_stops_before_unwritten_messages(tmp_path):
+    history = PlainHistory(str(tmp_path / 'chat.txt'))
+    write_lines(history.filepath, [make_line(number) for number in range(10)])
+
+    async def run():
+        history_window = await load_window(history, 10)
+        # shown as they came, not written to the history yet
+        history_window.append_messages(
+            [parse_message(make_line(number)) for number in range(10, 15)]
+        )
+        dropped_count = await history_window.trim_top(12)
+        lines, _ = await history.read_lines_after(
+            history_window.start_position,
+            1
+        )
+        return history_window, dropped_count, lines
+
+    history_window, dropped_count, lines = asyncio.run(run())
+    assert dropped_count == 9
+    assert history_window.line_count == 6
+    assert lines == [make_line(9)]
+
+
+def test_trim_top_starts_at_written_message(tmp_path):
+    history = PlainHistory(str(tmp_path / 'chat.txt'))
+    write_lines(history.filepath, [make_line(number) for number in range(5)])
+
+    async def run():
+        history_window = await load_window(history, 5)
+        messages = [
+            make_written_message(history, make_line(number))
+            for number in range(5, 8)
+        ]
+        history_window.append_messages(messages)
+        dropped_count = await history_window.trim_top(6)
+        return history_window, messages, dropped_count
+
+    history_window, messages, dropped_count = asyncio.run(run())
+    assert dropped_count == 6
+    start_position = history_window.get_message_position(messages[1])
+    assert history_window.start_position == start_position
+
+
+def test_trim_bottom_keeps_unwritten_messages_pending(tmp_path):
+    history = PlainHistory(str(tmp_path / 'chat.txt'))
+    write_lines(history.filepath, [make_line(number) for number in range(5)])
+
+    async def run():
+        history_window = await load_window(history, 5)
+        written_message = make_written_message(history, make_line(5))
+        unwritten_message = parse_message(make_line(6))
+        history_window.append_messages([written_message, unwritten_message])
+        kept_count = await history_window.trim_bottom(5)
+        end_position = history_window.end_position
+
+        lines, end_position = await history.read_lines_after(
+            end_position,
+            10
+        )
+        return history_window, kept_count, lines, end_position, (
+            written_message,
+            unwritten_message,
+        )
+
+    history_window, kept_count, lines, end_position, messages = asyncio.run(
+        run()
+    )
+    written_message, unwritten_message = messages
+    assert kept_count == 5
+    assert lines == [make_line(5)]
+    assert history_window.follow(end_position) == [unwritten_message]
+    assert history_window.is_following()
+
+
+def test_trim_bottom_waits_for_written_messages(tmp_path):
+    history = PlainHistory(str(tmp_path / 'chat.txt'))
+    write_lines(history.filepath, [make_line(number) for number in range(5)])
+
+    async def run():
+        history_window = await load_window(history, 5)
+        history_window.append_messages(
+            [parse_message(make_line(number)) for number in range(5, 8)]
+        )
+        return history_window, await history_window.trim_bottom(5)
+
+    history_window, kept_count = asyncio.run(run())
+    assert kept_count is None
+    assert history_window.is_following()
+    assert history_window.line_count == 8
+
+
+def test_pending_messages_keep_only_unwritten_ones(tmp_path):
+    history = PlainHistory(str(tmp_path / 'chat.txt'))
+    write_lines(history.filepath, [make_line(number) for number in range(5)])
+
+    async def run():
+        history_window = await load_window(history, 5)
+        await history_window.trim_bottom(3)
+        written_messages = [
+            make_written_message(history, make_line(number))
+            for number in range(5, 2005)
+        ]
+        unwritten_messages = [
+            parse_message(make_line(number)) for number in range(2005, 2010)
+        ]
+        history_window.add_pending_messages(written_messages)
+        history_window.add_pending_messages(unwritten_messages)
+        pending_messages = list(history_window.pending_messages)
+
+        # the user scrolls down to the end of the history
+        lines, end_position = await history.read_lines_after(
+            history_window.end_position,
+            3000
+        )
+        history_window.append_lines(lines, end_position)
+        return pending_messages, lines, history_window.follow(end_position)
+
+    pending_messages, lines, followed_messages = asyncio.run(run())
+    assert len(pending_messages) == 5
+    assert lines == [make_line(number) for number in range(3, 2005)]
+    assert [message.line for message in followed_messages] == [
+        make_line(number) for number in range(2005, 2010)
+    ]
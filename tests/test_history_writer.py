@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from history import CompressedHistory, HistoryWriter, PlainHistory
+from history import SegmentedHistory
+
+
+class FlakyHistoryWriter(HistoryWriter):
+    """Fail the first sync after the data is passed to the file."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures_left = 1
+
+    async def sync_file(self, file):
+        await super().sync_file(file)
+        if self.failures_left:
+            self.failures_left -= 1
+            raise OSError('No space left on device')
+
+
+def read_file(filepath):
+    with open(filepath, encoding='utf-8') as history_file:
+        return history_file.read()
+
+
+def test_failed_flush_keeps_lines_for_next_flush(tmp_path):
+    filepath = str(tmp_path / 'chat.txt')
+    writer = FlakyHistoryWriter(filepath)
+
+    async def run():
+        writer.add('first\n')
+        writer.add('second\n')
+        with pytest.raises(OSError):
+            await writer.flush()
+        writer.add('third\n')
+        written_lines = await writer.flush()
+        await writer.close()
+        return written_lines
+
+    written_lines = asyncio.run(run())
+    # the data of the failed write is not left in the file
+    assert read_file(filepath) == 'first\nsecond\nthird\n'
+    assert [line for _, _, line in written_lines] == [
+        'first\n',
+        'second\n',
+        'third\n',
+    ]
+    assert written_lines[2][1] == len('first\nsecond\n')
+    assert not writer.buffer
+    assert writer.buffer_size == 0
+
+
+@pytest.mark.parametrize('history_class', [
+    PlainHistory,
+    SegmentedHistory,
+    CompressedHistory,
+])
+def test_written_lines_are_read_back(tmp_path, history_class):
+    history = history_class(str(tmp_path / 'chat.txt'))
+    lines = [f'message {number}\n' for number in range(10)]
+
+    async def run():
+        async with history.create_writer(64 * 1024, 1, False) as writer:
+            for line in lines[:5]:
+                writer.add(line)
+            await writer.flush()
+            for line in lines[5:]:
+                writer.add(line)
+        before_lines, _ = await history.read_lines_before(
+            history.get_end_position(),
+            3
+        )
+        after_lines, end_position = await history.read_lines_after(
+            history.get_start_position(),
+            20
+        )
+        skipped_position = await history.skip_lines(
+            history.get_start_position(),
+            7
+        )
+        skipped_lines, _ = await history.read_lines_after(skipped_position, 1)
+        return before_lines, after_lines, skipped_lines
+
+    before_lines, after_lines, skipped_lines = asyncio.run(run())
+    assert before_lines == lines[-3:]
+    assert after_lines == lines
+    assert skipped_lines == [lines[7]]
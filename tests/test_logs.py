@@ -0,0 +1,50 @@
+import logging
+
+import pytest
+
+from logs import start_logging
+
+
+@pytest.fixture
+def restore_loggers():
+    root_logger = logging.getLogger()
+    root_handlers, root_level = root_logger.handlers[:], root_logger.level
+    yield
+    root_logger.handlers[:] = root_handlers
+    root_logger.setLevel(root_level)
+    for logger_name in ('test_sender', 'test_metrics', 'test_gui'):
+        logger = logging.getLogger(logger_name)
+        logger.filters.clear()
+        logger.setLevel(logging.NOTSET)
+
+
+def test_only_chatty_loggers_are_rate_limited(capsys, restore_loggers):
+    log_listener = start_logging(
+        {
+            'test_sender': (logging.DEBUG, logging.Formatter('%(message)s')),
+            'test_metrics': (logging.INFO, logging.Formatter('%(message)s')),
+        },
+        rate_limited_loggers=('test_sender',),
+        max_records_per_second=2,
+        level=logging.INFO,
+    )
+    try:
+        for number in range(5):
+            logging.getLogger('test_sender').debug('sent %d', number)
+            logging.getLogger('test_metrics').info('metrics %d', number)
+        logging.getLogger('test_sender').error('sender error')
+        logging.getLogger('test_gui').info('window info')
+        logging.getLogger('test_gui').debug('window debug')
+    finally:
+        log_listener.stop()
+
+    lines = capsys.readouterr().err.splitlines()
+    assert [line for line in lines if line.startswith('sent')] == [
+        'sent 0',
+        'sent 1',
+    ]
+    assert len([line for line in lines if line.startswith('metrics')]) == 5
+    assert 'sender error' in lines
+    # the other loggers go through the queue in the default format
+    assert 'INFO:test_gui:window info' in lines
+    assert 'DEBUG:test_gui:window debug' not in lines
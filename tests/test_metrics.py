@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+from metrics import dump_snapshot, format_snapshot, Histogram, Metrics
+
+
+def test_histogram_percentiles_are_bucket_bounds():
+    histogram = Histogram()
+    for _ in range(99):
+        histogram.observe(0.001)
+    histogram.observe(1)
+
+    assert histogram.count == 100
+    # 1 ms falls into the bucket bounded by 0.1 ms * 2 ** 4
+    assert histogram.get_percentile(50) == Histogram.bucket_bounds[4]
+    assert histogram.get_percentile(99) == Histogram.bucket_bounds[4]
+    assert histogram.get_percentile(100) == 1
+    assert histogram.get_summary()['max'] == 1
+
+
+def test_histogram_percentile_never_exceeds_max():
+    histogram = Histogram()
+    histogram.observe(0.003)
+    assert histogram.get_percentile(50) == 0.003
+    assert Histogram().get_percentile(50) == 0
+
+
+def test_histogram_keeps_values_over_the_last_bound():
+    histogram = Histogram()
+    histogram.observe(1000)
+    assert histogram.bucket_counts[-1] == 1
+    assert histogram.get_percentile(99) == 1000
+
+
+def test_snapshot_reports_counter_rates_since_last_snapshot():
+    metrics = Metrics()
+    metrics.counter('messages_received').increment(5)
+    first_snapshot = metrics.get_snapshot()
+    second_snapshot = metrics.get_snapshot()
+
+    assert first_snapshot['counters']['messages_received'] == 5
+    assert first_snapshot['rates']['messages_received'] > 0
+    assert second_snapshot['counters']['messages_received'] == 5
+    assert second_snapshot['rates']['messages_received'] == 0
+
+
+def test_snapshot_is_formatted_and_dumped(tmp_path):
+    metrics = Metrics()
+    metrics.counter('reconnects').increment()
+    metrics.histogram('history_write_seconds').observe(0.002)
+    sending_queue = asyncio.Queue()
+    sending_queue.put_nowait('first')
+    sending_queue.put_nowait('second')
+    metrics.watch_queue('sending_queue', sending_queue)
+    snapshot = metrics.get_snapshot()
+    line = format_snapshot(snapshot)
+    assert 'reconnects=1' in line
+    assert 'sending_queue=2' in line
+    assert 'history_write_seconds: p50=' in line
+
+    filepath = tmp_path / 'metrics.json'
+    dump_snapshot(snapshot, str(filepath))
+    assert json.loads(filepath.read_text()) == snapshot
@@ -0,0 +1,67 @@
+import asyncio
+
+from metrics import metrics
+from queues import DropOldestQueue, SkippingQueue
+
+
+def make_summary(skipped_count):
+    return f'skipped {skipped_count}'
+
+
+def read_all(queue):
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+
+def test_skipping_queue_summarizes_skipped_items():
+    queue = SkippingQueue(2, 'test_skipping_queue', make_summary)
+    overflow_counter = metrics.counter('test_skipping_queue_overflow')
+    overflow_count = overflow_counter.value
+    for item in 'abcd':
+        queue.put_nowait(item)
+
+    assert overflow_counter.value - overflow_count == 2
+    assert read_all(queue) == ['a', 'b', 'skipped 2']
+    queue.put_nowait('e')
+    assert read_all(queue) == ['e']
+
+
+def test_skipping_queue_puts_summary_before_next_item():
+    queue = SkippingQueue(2, 'test_skipping_queue', make_summary)
+    for item in 'abc':
+        queue.put_nowait(item)
+    assert queue.get_nowait() == 'a'
+    # the summary takes the extra slot, the new item still fits
+    queue.put_nowait('d')
+    assert read_all(queue) == ['b', 'skipped 1', 'd']
+
+
+def test_skipping_queue_get_waits_for_items():
+    queue = SkippingQueue(1, 'test_skipping_queue', make_summary)
+
+    async def run():
+        queue.put_nowait('a')
+        queue.put_nowait('b')
+        return [await queue.get(), await queue.get()]
+
+    assert asyncio.run(run()) == ['a', 'skipped 1']
+
+
+def test_unbounded_skipping_queue_skips_nothing():
+    queue = SkippingQueue(0, 'test_skipping_queue', make_summary)
+    for item in range(100):
+        queue.put_nowait(item)
+    assert read_all(queue) == list(range(100))
+
+
+def test_drop_oldest_queue_keeps_newest_items():
+    queue = DropOldestQueue(2, 'test_drop_oldest_queue')
+    overflow_counter = metrics.counter('test_drop_oldest_queue_overflow')
+    overflow_count = overflow_counter.value
+    for item in 'abcd':
+        queue.put_nowait(item)
+
+    assert overflow_counter.value - overflow_count == 2
+    assert read_all(queue) == ['c', 'd']
@@ -0,0 +1,167 @@
+import asyncio
+import errno
+
+from anyio import ExceptionGroup
+import pytest
+
+from main import get_connection_errors
+from open_connection import ConnectionAttemptsExceeded, open_connection
+from open_connection import ReconnectPolicy
+from process_messages import read_msgs, read_server_response
+from process_messages import supervise_connection
+from statuses import ReadConnectionStateChanged, ReconnectScheduled
+
+
+def make_policy(max_attempts):
+    return ReconnectPolicy(
+        connect_timeout=1,
+        initial_delay=0.001,
+        max_delay=0.001,
+        max_attempts=max_attempts,
+    )
+
+
+async def get_closed_port():
+    server = await asyncio.start_server(lambda *_: None, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    server.close()
+    await server.wait_closed()
+    return port
+
+
+def test_failed_attempts_are_counted_across_calls():
+    reconnect_policy = make_policy(max_attempts=3)
+
+    async def connect(port):
+        async with open_connection('127.0.0.1', port, reconnect_policy):
+            pass
+
+    async def run():
+        port = await get_closed_port()
+        with pytest.raises(ConnectionAttemptsExceeded):
+            await connect(port)
+        assert reconnect_policy.failed_attempts == 3
+        # the outage goes on, the next call does not start from scratch
+        with pytest.raises(ConnectionAttemptsExceeded, match='4 attempts'):
+            await connect(port)
+
+    asyncio.run(run())
+
+
+def test_dropped_connections_exceed_the_attempts():
+    reconnect_policy = make_policy(max_attempts=3)
+    status_queue = asyncio.Queue()
+
+    async def drop_connection(reader, writer):
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(drop_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            await asyncio.wait_for(
+                supervise_connection(
+                    reconnect_policy,
+                    status_queue,
+                    ReadConnectionStateChanged,
+                    read_msgs,
+                    None,
+                    asyncio.Queue(),
+                    '127.0.0.1',
+                    port,
+                    status_queue,
+                    reconnect_policy,
+                ),
+                timeout=5,
+            )
+
+    with pytest.raises(ConnectionAttemptsExceeded, match='3 times'):
+        asyncio.run(run())
+    # the user sees the reconnects after the dropped connections
+    scheduled_reconnects = []
+    while not status_queue.empty():
+        status = status_queue.get_nowait()
+        if isinstance(status, ReconnectScheduled):
+            scheduled_reconnects.append(status)
+    assert [status.attempt_number for status in scheduled_reconnects] == [
+        1,
+        2,
+    ]
+    assert all(
+        status.state_class is ReadConnectionStateChanged
+        for status in scheduled_reconnects
+    )
+
+
+def test_server_answer_resets_the_attempts():
+    reconnect_policy = make_policy(max_attempts=2)
+    history_queue = asyncio.Queue()
+
+    async def send_line_and_drop(reader, writer):
+        writer.write(b'[18.06.21 12:34] Bob: hello\n')
+        await writer.drain()
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(
+            send_line_and_drop,
+            '127.0.0.1',
+            0
+        )
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            task = asyncio.ensure_future(supervise_connection(
+                reconnect_policy,
+                None,
+                None,
+                read_msgs,
+                None,
+                history_queue,
+                '127.0.0.1',
+                port,
+                asyncio.Queue(),
+                reconnect_policy,
+            ))
+            while history_queue.qsize() < 5:
+                await asyncio.sleep(0.01)
+            assert not task.done()
+            task.cancel()
+
+    asyncio.run(run())
+    assert reconnect_policy.failed_attempts <= 1
+
+
+def test_connection_errors_are_unwrapped_from_groups():
+    errors = [
+        ConnectionAttemptsExceeded('read'),
+        ConnectionAttemptsExceeded('send'),
+    ]
+    error_group = ExceptionGroup()
+    nested_group = ExceptionGroup()
+    nested_group.exceptions = errors[1:]
+    error_group.exceptions = [errors[0], nested_group]
+    assert get_connection_errors(error_group) == errors
+
+    error_group.exceptions = [errors[0], ValueError()]
+    assert get_connection_errors(error_group) is None
+
+
+class DeadPeerReader:
+    async def readline(self):
+        # the keepalive probes got no answer
+        raise TimeoutError(errno.ETIMEDOUT, 'Connection timed out')
+
+
+def test_failed_keepalive_restarts_the_stream():
+    reconnect_policy = make_policy(max_attempts=2)
+
+    async def read_dead_peer():
+        await read_server_response(DeadPeerReader(), ping_timeout=5)
+
+    with pytest.raises(ConnectionAttemptsExceeded, match='2 times'):
+        asyncio.run(supervise_connection(
+            reconnect_policy,
+            None,
+            None,
+            read_dead_peer,
+        ))
@@ -0,0 +1,78 @@
+import asyncio
+from pathlib import Path
+import sqlite3
+import subprocess
+import sys
+
+from history import CompressedHistory, PlainHistory, SegmentedHistory
+from search_index import make_match_query, SearchIndex
+from statuses import ErrorOccurred
+
+
+def test_make_match_query_quotes_every_word():
+    assert make_match_query('hello world') == '"hello" "world"'
+    assert make_match_query('  NOT "a*  ') == '"NOT" """a*"'
+    assert make_match_query('   ') == ''
+
+
+def test_found_lines_keep_their_history_location(tmp_path):
+    history = SegmentedHistory(str(tmp_path / 'chat.txt'))
+    search_index = SearchIndex(str(tmp_path / 'chat.txt.search'))
+
+    async def run():
+        async with history.create_writer(64 * 1024, 1, False) as writer:
+            writer.add('Bob: hello world\n')
+            writer.add('Eve: good bye\n')
+        await search_index.open()
+        try:
+            await search_index.catch_up(history)
+            return await search_index.search('bye')
+        finally:
+            await search_index.close()
+
+    found_lines = asyncio.run(run())
+    assert found_lines == [(0, len('Bob: hello world\n'), 'Eve: good bye')]
+    segment_number, offset, _ = found_lines[0]
+    assert history.format_location(segment_number, offset) == (
+        f'{history.filepath}.000000:{offset}'
+    )
+
+
+def test_compressed_location_has_no_offset(tmp_path):
+    filepath = str(tmp_path / 'chat.txt.gz')
+    assert CompressedHistory(filepath).format_location(0, 10) == filepath
+    assert PlainHistory(filepath).format_location(0, 10) == f'{filepath}:10'
+
+
+def test_query_of_broken_index_exits_with_error(tmp_path):
+    history_filepath = tmp_path / 'chat.txt'
+    history_filepath.write_text('Bob: hello\n', encoding='utf-8')
+    index_filepath = tmp_path / 'chat.txt.search'
+    # a plain table in place of the full-text one can not be matched
+    connection = sqlite3.connect(index_filepath)
+    connection.execute('CREATE TABLE messages (text, segment, offset)')
+    connection.close()
+
+    completed_process = subprocess.run(
+        [
+            sys.executable,
+            'search_index.py',
+            '--history_filepath',
+            str(history_filepath),
+            '--query',
+            'hello',
+        ],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+    )
+    assert completed_process.returncode == 1
+    assert 'Can not search the index' in completed_process.stderr
+
+
+def test_index_in_missing_directory_is_reported(tmp_path):
+    search_index = SearchIndex(str(tmp_path / 'missing' / 'chat.search'))
+    status_queue = asyncio.Queue()
+
+    assert not asyncio.run(search_index.open(status_queue))
+    assert isinstance(status_queue.get_nowait(), ErrorOccurred)
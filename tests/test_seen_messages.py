@@ -0,0 +1,108 @@
+import asyncio
+
+from history import PlainHistory
+from messages import SeenMessages
+from process_messages import read_msgs
+
+
+def make_line(text):
+    return f'[18.06.21 12:34] Bob: {text}\n'
+
+
+def remember_lines(seen_messages, texts):
+    return [
+        text
+        for text in texts
+        if seen_messages.remember(make_line(text))
+    ]
+
+
+def test_repeated_live_message_is_kept():
+    seen_messages = SeenMessages(10)
+    seen_messages.start_replay()
+    assert remember_lines(seen_messages, ['+1', '+1', 'ok', '+1']) == [
+        '+1',
+        '+1',
+        'ok',
+        '+1',
+    ]
+
+
+def test_replayed_overlap_is_dropped():
+    seen_messages = SeenMessages(10)
+    remember_lines(seen_messages, ['a', 'b', 'c', 'd'])
+
+    # the server sends its last messages again with the missed ones
+    seen_messages.start_replay()
+    assert remember_lines(seen_messages, ['b', 'c', 'd', 'e', 'c']) == [
+        'e',
+        'c',
+    ]
+
+
+def test_replay_ends_at_first_new_line():
+    seen_messages = SeenMessages(10)
+    remember_lines(seen_messages, ['+1', 'a', '+1'])
+
+    seen_messages.start_replay()
+    assert remember_lines(seen_messages, ['a', '+1', 'b', '+1', 'a']) == [
+        'b',
+        '+1',
+        'a',
+    ]
+
+
+def test_replay_of_repeated_run_is_dropped_whole():
+    seen_messages = SeenMessages(10)
+    remember_lines(seen_messages, ['a', 'b', 'a', 'b'])
+
+    seen_messages.start_replay()
+    assert remember_lines(seen_messages, ['a', 'b', 'a', 'b', 'c']) == ['c']
+
+
+def test_replay_after_history_tail_is_dropped(tmp_path):
+    history = PlainHistory(str(tmp_path / 'chat.txt'))
+    with open(history.filepath, 'w', encoding='utf-8') as history_file:
+        history_file.writelines(make_line(text) for text in 'abc')
+    seen_messages = SeenMessages(2)
+    asyncio.run(seen_messages.load_history_tail(history))
+
+    seen_messages.start_replay()
+    assert remember_lines(seen_messages, ['b', 'c', 'd']) == ['d']
+    # a line older than the remembered ones is not recognized as replayed
+    seen_messages.start_replay()
+    assert remember_lines(seen_messages, ['a', 'd']) == ['a', 'd']
+
+
+def test_reading_stream_waits_for_history_tail(tmp_path):
+    history = PlainHistory(str(tmp_path / 'chat.txt'))
+    with open(history.filepath, 'w', encoding='utf-8') as history_file:
+        history_file.writelines(make_line(text) for text in 'ab')
+    seen_messages = SeenMessages(10)
+    history_queue = asyncio.Queue()
+
+    async def replay_history(reader, writer):
+        writer.writelines(make_line(text).encode() for text in 'abc')
+        await writer.drain()
+
+    async def run():
+        server = await asyncio.start_server(replay_history, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            task = asyncio.ensure_future(read_msgs(
+                None,
+                history_queue,
+                '127.0.0.1',
+                port,
+                asyncio.Queue(),
+                seen_messages=seen_messages,
+            ))
+            await asyncio.sleep(0.1)
+            assert history_queue.empty()
+            # the window is shown, the client reads the history tail
+            await seen_messages.load_history_tail(history)
+            message = await asyncio.wait_for(history_queue.get(), timeout=5)
+            task.cancel()
+        return message
+
+    assert asyncio.run(run()).line == make_line('c')
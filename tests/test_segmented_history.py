@@ -0,0 +1,75 @@
+import asyncio
+import os
+
+from history import SegmentedHistory
+
+
+async def write_batches(history, batches):
+    async with history.create_writer(64 * 1024, 1, False) as writer:
+        for timestamp, lines in batches:
+            for line in lines:
+                writer.add(line)
+            writer.buffer_start_timestamp = timestamp
+            await writer.flush()
+
+
+def make_batches():
+    return [
+        (timestamp, [f'{timestamp} message {number}\n' for number in range(3)])
+        for timestamp in (100, 200, 300, 400)
+    ]
+
+
+def test_segments_rotate_and_old_ones_are_removed(tmp_path):
+    history = SegmentedHistory(
+        str(tmp_path / 'chat.txt'),
+        segment_size=10,
+        max_segments=2
+    )
+    asyncio.run(write_batches(history, make_batches()))
+
+    # every batch is over the segment size, so it gets its own segment
+    assert history.get_segment_numbers() == [2, 3]
+    lines, _ = asyncio.run(history.read_lines_after(
+        history.get_start_position(),
+        10
+    ))
+    assert lines == make_batches()[2][1] + make_batches()[3][1]
+
+
+def test_read_time_range_reads_the_covering_batches(tmp_path):
+    history = SegmentedHistory(str(tmp_path / 'chat.txt'), segment_size=60)
+    batches = make_batches()
+    asyncio.run(write_batches(history, batches))
+    assert len(history.get_segment_numbers()) > 1
+
+    lines = asyncio.run(history.read_time_range(200, 350))
+    assert lines == batches[1][1] + batches[2][1]
+
+    # the batch written before the range start may hold its messages
+    lines = asyncio.run(history.read_time_range(250, 260))
+    assert lines == batches[1][1]
+
+    assert asyncio.run(history.read_time_range(500, 600)) == batches[3][1]
+    assert asyncio.run(history.read_time_range(0, 50)) == []
+
+
+def test_segment_list_is_read_once_per_rotation(tmp_path, monkeypatch):
+    history = SegmentedHistory(str(tmp_path / 'chat.txt'), segment_size=10)
+    asyncio.run(write_batches(history, make_batches()[:2]))
+    listed_directories = []
+    original_listdir = os.listdir
+
+    def listdir(directory):
+        listed_directories.append(directory)
+        return original_listdir(directory)
+
+    monkeypatch.setattr(os, 'listdir', listdir)
+    for _ in range(3):
+        assert history.is_start_position((0, 0))
+    assert not listed_directories
+
+    # the writer starts a new segment and refreshes the list
+    asyncio.run(write_batches(history, make_batches()[2:3]))
+    assert history.get_segment_numbers() == [0, 1, 2]
+    assert len(listed_directories) == 2
@@ -0,0 +1,98 @@
+import asyncio
+
+from fake_server import ChatServer
+from open_connection import ReconnectPolicy
+from process_messages import filter_message, Outbox, send_messages
+from process_messages import supervise_connection
+from statuses import ErrorOccurred, SendingConnectionStateChanged
+
+
+async def reject_token(reader, writer):
+    writer.write(b'Hello %username%! Enter your personal hash.\n')
+    await reader.readline()
+    writer.write(b'null\n')
+    await writer.drain()
+    writer.close()
+
+
+def read_statuses(status_queue):
+    statuses = []
+    while not status_queue.empty():
+        statuses.append(status_queue.get_nowait())
+    return statuses
+
+
+def test_rejected_token_stops_only_the_sending_stream():
+    status_queue = asyncio.Queue()
+
+    async def run():
+        server = await asyncio.start_server(reject_token, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        reconnect_policy = ReconnectPolicy(connect_timeout=1)
+        async with server:
+            await asyncio.wait_for(
+                supervise_connection(
+                    reconnect_policy,
+                    None,
+                    None,
+                    send_messages,
+                    '127.0.0.1',
+                    port,
+                    Outbox(),
+                    'bad token',
+                    status_queue,
+                    reconnect_policy,
+                ),
+                timeout=5,
+            )
+
+    # the supervisor returns instead of failing the other streams
+    asyncio.run(run())
+    statuses = read_statuses(status_queue)
+    assert any(isinstance(status, ErrorOccurred) for status in statuses)
+    assert statuses[-1] == SendingConnectionStateChanged.CLOSED
+
+
+class RecordingChatServer(ChatServer):
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    def broadcast(self, nickname, text):
+        self.texts.append(text)
+
+
+def test_each_sent_message_is_acknowledged_once():
+    server = RecordingChatServer()
+    sending_queue = Outbox()
+    for message in ['first', '', '\nsecond\n', 'third\n\n\nline', '\n\n']:
+        sending_queue.put_nowait(message)
+
+    async def run():
+        sending_server = await asyncio.start_server(
+            server.handle_sender,
+            '127.0.0.1',
+            0
+        )
+        port = sending_server.sockets[0].getsockname()[1]
+        async with sending_server:
+            task = asyncio.ensure_future(send_messages(
+                '127.0.0.1',
+                port,
+                sending_queue,
+                'token',
+                asyncio.Queue(),
+                max_messages_in_flight=2,
+            ))
+            while sending_queue.qsize() or len(server.texts) < 3:
+                await asyncio.sleep(0.01)
+                assert not task.done()
+            task.cancel()
+
+    asyncio.run(run())
+    assert server.texts == ['first', 'second', 'third line']
+
+
+def test_filter_message_drops_empty_lines():
+    assert filter_message('\nfirst\n\n\nsecond\n') == 'first\nsecond'
+    assert filter_message('\n\n') == ''
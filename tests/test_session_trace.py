@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import socket
+
+from benchmarks.replay import run_replay
+from session_trace import parse_records, read_trace, RECEIVED
+from session_trace import RECORD_HEADER, SENT, SessionRecorder
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def record_session(filepath, records):
+    session_recorder = SessionRecorder(filepath)
+
+    async def run():
+        for kind, data in records:
+            session_recorder.record(kind, data)
+            # every flush appends a block
+            await session_recorder.flush()
+
+    asyncio.run(run())
+
+
+def test_records_are_read_back(tmp_path):
+    filepath = str(tmp_path / 'session.trace')
+    records = [
+        (RECEIVED, '[18.06.21 12:34] Bob: привет\n'.encode()),
+        (SENT, b'hello\n\n'),
+        (RECEIVED, b''),
+    ]
+    record_session(filepath, records)
+
+    read_records = asyncio.run(read_trace(filepath))
+    assert [(record.kind, record.data) for record in read_records] == records
+    timestamps = [record.timestamp for record in read_records]
+    assert timestamps == sorted(timestamps)
+
+
+def test_record_cut_by_crash_is_skipped():
+    data = RECORD_HEADER.pack(1.0, RECEIVED, 6) + b'first\n'
+    data += RECORD_HEADER.pack(2.0, RECEIVED, 7) + b'sec'
+    records = parse_records(data)
+    assert [record.data for record in records] == [b'first\n']
+
+
+def test_replay_skips_the_messages_sender_does_not_send(tmp_path, capsys):
+    filepath = str(tmp_path / 'session.trace')
+    record_session(filepath, [
+        (RECEIVED, b'[18.06.21 12:34] Bob: hello\n'),
+        (SENT, b'\n\n'),
+        (SENT, b'hi Bob\n\n'),
+        (RECEIVED, b'[18.06.21 12:35] Bob: bye\n'),
+    ])
+    arguments = argparse.Namespace(
+        host='127.0.0.1',
+        reading_port=get_free_port(),
+        sending_port=get_free_port(),
+        speed=0,
+        max_pause=5,
+        history_format='plain',
+        render=False,
+    )
+
+    async def run():
+        records = await read_trace(filepath)
+        await asyncio.wait_for(
+            run_replay(arguments, records, str(tmp_path)),
+            timeout=10
+        )
+
+    asyncio.run(run())
+    report = capsys.readouterr().out
+    assert 'received messages: 2' in report
+    assert 'sent messages: 1' in report
+
+
+def test_failed_write_keeps_the_records(tmp_path):
+    filepath = tmp_path / 'missing' / 'session.trace'
+    session_recorder = SessionRecorder(str(filepath), flush_interval=0.01)
+
+    async def run():
+        session_recorder.record(RECEIVED, b'hello\n')
+        task = asyncio.ensure_future(session_recorder.run())
+        await asyncio.sleep(0.05)
+        # the chat goes on while the trace can not be written
+        assert not task.done()
+        filepath.parent.mkdir()
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(run())
+    read_records = asyncio.run(read_trace(str(filepath)))
+    assert [record.data for record in read_records] == [b'hello\n']
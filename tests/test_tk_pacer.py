@@ -0,0 +1,35 @@
+import asyncio
+import time
+
+from gui import TkPacer
+
+
+def test_interval_grows_when_idle_and_resets_on_activity():
+    tk_pacer = TkPacer(min_interval=0.01, max_interval=0.1, idle_timeout=1)
+    assert tk_pacer.get_interval() == 0.01
+
+    tk_pacer.last_activity_time = time.monotonic() - 2
+    intervals = [tk_pacer.get_interval() for _ in range(10)]
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == 0.1
+
+    tk_pacer.notify()
+    assert tk_pacer.get_interval() == 0.01
+
+
+def test_notify_wakes_the_waiting_loop():
+    tk_pacer = TkPacer(min_interval=10, max_interval=10)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.01, tk_pacer.notify)
+        start_time = time.monotonic()
+        await tk_pacer.wait()
+        return time.monotonic() - start_time
+
+    assert asyncio.run(run()) < 1
+    assert tk_pacer.wakeups_count == 1
+
+
+def test_pointer_motion_is_not_watched():
+    assert '<Motion>' not in TkPacer.input_events